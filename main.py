@@ -2,9 +2,14 @@ import os
 import time
 import logging
 from stream.produce import CameraProducer
+from stream.relay import build_nodes
 from utils.config import ConfigLoader
+from utils import frame_buffer
+from utils.indices import probe_all
+from utils.tiering import StorageTiering
 from utils.restart import restart_script
 from web.server import StreamingServer
+from web.stream_workers import StreamWorkers
 
 logging.basicConfig(
     level=logging.INFO,
@@ -23,20 +28,34 @@ def main():
         config = ConfigLoader()
         config.clear_refresh()
 
+        # Stream worker processes read frames from shared memory
+        if config.server_stream_workers > 0:
+            frame_buffer.use_shared_memory(f"optivue_{os.getpid()}", config.server_frame_slot_kb * 1024)
+
+        # Supported modes of every attached camera (cached after first probe)
+        capabilities = probe_all(cache_file=config.capability_cache)
+
         # Start one producer per camera
         producers = []
         for cam_index in config.cameras:
+            profile = config.profile(cam_index)
             p = CameraProducer(
                 cam_index,
-                width=config.camera_width,
-                height=config.camera_height,
-                fps=config.camera_fps,
-                motion_area=config.motion_contour_area,
-                config=config,
+                width=profile.camera_width,
+                height=profile.camera_height,
+                fps=profile.camera_fps,
+                motion_area=profile.motion_contour_area,
+                config=profile,
+                capabilities=capabilities.get(cam_index),
             )
             p.start()
             producers.append(p)
 
+        # Cameras relayed from other OptiVue instances
+        relay_nodes = build_nodes(config)
+        for node in relay_nodes:
+            node.start()
+
         # Give producers a moment to register their FrameBuffers
         time.sleep(0.2)
 
@@ -45,9 +64,18 @@ def main():
             host=config.server_host,
             port=config.server_port,
             config=config,
+            producers=producers + [p for node in relay_nodes for p in node.producers],
         )
         server.start()
 
+        # Live streams served from separate processes (server.stream_workers)
+        stream_workers = StreamWorkers(config)
+        stream_workers.start()
+
+        # Downsample aging clips at low priority, yielding to capture
+        tiering = StorageTiering(config, producers)
+        tiering.start()
+
         # Wait until a settings save triggers a reload
         try:
             while not config.check_refresh():
@@ -58,6 +86,10 @@ def main():
 
         log.info("Config reload requested ...restarting...")
 
+        tiering.stop()
+        stream_workers.stop()
+        for node in relay_nodes:
+            node.stop()
         for p in producers:
             p.stop()
         server.stop()
@@ -1,32 +1,95 @@
 """
 produce.py  –  stream/produce.py
 
-CameraProducer captures frames, runs optional motion detection, adds overlay,
-then:
+CameraProducer captures frames, runs optional motion detection, publishes the
+frame's metadata (motion state, box, capture time) to the metadata hub, then:
 
-  1. Calls MotionSnapshot.on_frame() to save a JPEG still on motion events.
-  2. Calls CameraRecorder.write() to append to the rolling MP4 clip.
+  1. Calls MotionSnapshot.on_frame() to queue JPEG stills of motion events.
+  2. Calls CameraRecorder.write() to append to the rolling clip.
   3. Pushes the encoded JPEG into a FrameBuffer for all streaming clients.
+
+Frames are left unannotated unless `camera.burn_in` is set; browsers draw
+the overlay from the metadata stream instead.
+
+Capture is supervised: a source that stops delivering frames is released and
+reopened with exponential backoff, and a camera whose /dev/video node has
+gone sleeps until utils.hotplug reports it back.  `state` is one of
+starting / live / retrying / dead / stopped.
+
+Frames that are effectively unchanged from the last one sent are neither
+encoded nor pushed (utils/static_scene.py); viewers still get one at least
+every `camera.static_keepalive` seconds.
+
+Pacing follows the device's own frame timestamps: every frame is grabbed at
+the sensor's rate and only those FramePacer keeps are decoded, so there are
+no sleeps to stack on top of the blocking read.
 """
 
 from utils.motion import MotionDetector
-from utils.overlays import add_overlay
+from utils.overlays import add_overlay, add_motion_box
+from utils.metadata import hub as metadata_hub
 from utils.frame_buffer import get_or_create as get_frame_buffer
 from utils.recorder import CameraRecorder, MotionSnapshot
+from utils import hotplug
+from utils.pacing import FramePacer, capture_timestamp, to_wall_clock
+from utils.indices import choose_mode
+from utils import classifier
+from utils.static_scene import StaticSceneFilter
+from utils.capture_state import (
+    STATE_STARTING, STATE_LIVE, STATE_RETRYING, STATE_DEAD, STATE_STOPPED,
+)
 import cv2
+import numpy as np
 import time
+import logging
 import threading
 
+log = logging.getLogger(__name__)
+
+BACKOFF_MIN = 0.5                # seconds
+BACKOFF_MAX = 30.0
+STALL_TIMEOUT = 2.0              # no good frame for this long -> reopen
+DEAD_POLL = 5.0                  # presence re-check when hot-plug events are unavailable
+
+
+def crop_to_aspect(frame, width: int, height: int):
+    """Centre crop of `frame` (a view, no copy) with the aspect ratio of width x height."""
+    h, w = frame.shape[:2]
+    if w * height > h * width:
+        crop_w = max(h * width // height, 1)
+        x = (w - crop_w) // 2
+        return frame[:, x:x + crop_w]
+    crop_h = max(w * height // width, 1)
+    y = (h - crop_h) // 2
+    return frame[y:y + crop_h]
+
 
 class CameraProducer:
     def __init__(self, cam_index, pipe_dir=None,
-                 width=320, height=240, fps=10, motion_area=500, config=None):
+                 width=320, height=240, fps=10, motion_area=500, config=None,
+                 capabilities=None):
         self.cam_index = cam_index
         self.width = width
         self.height = height
         self.fps = fps
         self.config = config
-        self.frame_interval = 1.0 / fps
+
+        # Native sensor mode closest to the request (from utils.indices), so
+        # the driver never has to scale or fall back to a slower format
+        self.capabilities = capabilities
+        self.mode = choose_mode(capabilities, width, height, fps)
+        if self.mode and (self.mode["width"], self.mode["height"]) != (width, height):
+            log.info(f"[cam{cam_index}] {width}x{height} is not a native mode; "
+                     f"capturing {self.mode['width']}x{self.mode['height']} {self.mode['fourcc']} "
+                     f"and scaling to {width}x{height}")
+
+        # Timestamp-driven decimation from the sensor rate down to `fps`
+        self.pacer = FramePacer(fps)
+
+        # Reused decode target for cap.retrieve(), and for scaling a larger
+        # native mode back down to the configured size
+        self._frame = None
+        self._scaled = None
 
         # Shared frame buffer – one per camera, many clients can read it
         self.frame_buffer = get_frame_buffer(cam_index)
@@ -38,78 +101,256 @@ class CameraProducer:
         # Motion detector (only created if enabled)
         self.motion_detector = MotionDetector(contour_area=motion_area) if config.motion_detection else None
 
+        # Optional people classifier behind the motion gate.  With
+        # detection.trigger = person, snapshots and recording key on it.
+        self.classifier = None
+        if self.motion_detector and getattr(config, "detection_enabled", False):
+            if classifier.available():
+                self.classifier = classifier.ObjectClassifier(cam_index, config)
+            else:
+                log.warning(f"[cam{cam_index}] detection.enabled is set but this OpenCV build "
+                            f"has no HOG people detector; using motion only")
+        self.event_trigger = getattr(config, "detection_trigger", "motion") if self.classifier else "motion"
+
         self._stop_event = threading.Event()
+        self._wake = threading.Event()
+        self.state = STATE_STARTING
+        self.retries = 0
+        self.last_error = None
         self.thread = threading.Thread(target=self._run, daemon=True,
                                        name=f"producer-cam{cam_index}")
 
         # Cache motion state to avoid running detection on every frame
-        self.motion_check_interval = 3
+        self.motion_check_interval = max(int(getattr(config, "motion_interval", 3)), 1)
+        self.jpeg_quality = int(getattr(config, "jpeg_quality", 60))
         self.last_motion_state = False
 
+        # Burn status text and motion box into the pixels (legacy behaviour)
+        self.burn_in = getattr(config, "burn_in", False)
+
+        # Skip encode + push for unchanged frames on a still scene.  A
+        # burned-in clock must still tick, so keepalive is at most 1 s then.
+        self.static_filter = None
+        if getattr(config, "suppress_static", False):
+            keepalive = float(getattr(config, "static_keepalive", 1.0))
+            if self.burn_in:
+                keepalive = min(keepalive, 1.0)
+            self.static_filter = StaticSceneFilter(
+                float(getattr(config, "static_threshold", 0.005)), keepalive)
+
     def start(self):
         self._stop_event.clear()
+        hotplug.watcher.watch(self.cam_index, self._on_hotplug)
         self.thread.start()
 
     def stop(self):
         self._stop_event.set()
+        self._wake.set()
+        hotplug.watcher.unwatch(self.cam_index, self._on_hotplug)
         self.thread.join(timeout=5.0)
         self.recorder.stop()
+        self.snapshotter.flush()
         self.frame_buffer.close()
+        self.state = STATE_STOPPED
+
+    def status(self) -> dict:
+        """Snapshot of capture health for the /status endpoint."""
+        return {
+            "cam":        self.cam_index,
+            "state":      self.state,
+            "retries":    self.retries,
+            "last_error": self.last_error,
+            "mode":       self.mode,
+            "resolution": f"{self.width}x{self.height}",
+            "fps":        self.fps,
+            **self.pacer.stats(),
+            **self.snapshotter.stats(),
+            **(self.classifier.stats() if self.classifier else {}),
+            **(self.static_filter.stats() if self.static_filter else {}),
+        }
+
+    # ------------------------------------------------------------------
+    # Supervision
+    # ------------------------------------------------------------------
+
+    def _on_hotplug(self, cam_index, present):
+        # Called from the watchdog thread; cut any backoff / dead wait short
+        self._wake.set()
+
+    def _sleep(self, timeout):
+        """Interruptible wait – returns early on stop() or a hot-plug event."""
+        self._wake.wait(timeout=timeout)
+        self._wake.clear()
+
+    def _set_state(self, state, error=None):
+        if state != self.state:
+            log.info(f"[cam{self.cam_index}] {self.state} -> {state}"
+                     + (f" ({error})" if error else ""))
+        self.state = state
+        if error:
+            self.last_error = error
 
     def _run(self):
+        backoff = BACKOFF_MIN
+        while not self._stop_event.is_set():
+            if not hotplug.device_present(self.cam_index):
+                # Nothing to open: sleep until the device node reappears
+                self._set_state(STATE_DEAD, f"{hotplug.device_path(self.cam_index)} missing")
+                self._sleep(None if hotplug.watcher.available else DEAD_POLL)
+                backoff = BACKOFF_MIN
+                continue
+
+            cap = self._open_capture()
+            if cap is None:
+                self.retries += 1
+                self._set_state(STATE_RETRYING, "could not open device")
+                self._sleep(backoff)
+                backoff = min(backoff * 2, BACKOFF_MAX)
+                continue
+
+            self._set_state(STATE_LIVE)
+            self._wake.clear()          # stale hot-plug events are moot once live
+            self.pacer.reset()
+            if self.static_filter:
+                self.static_filter.reset()
+            opened_at = time.monotonic()
+            try:
+                self._capture(cap)
+            finally:
+                cap.release()
+
+            if self._stop_event.is_set():
+                break
+
+            # A source that ran for a while before failing starts afresh
+            if time.monotonic() - opened_at > BACKOFF_MAX:
+                backoff = BACKOFF_MIN
+            self.retries += 1
+            self._set_state(STATE_RETRYING, "capture stalled")
+            self._sleep(backoff)
+            backoff = min(backoff * 2, BACKOFF_MAX)
+
+    def _open_capture(self):
         cap = cv2.VideoCapture(self.cam_index, cv2.CAP_V4L2)
         if not cap.isOpened():
             cap = cv2.VideoCapture(self.cam_index)
+        if not cap.isOpened():
+            cap.release()
+            return None
 
-        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'))
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
-        cap.set(cv2.CAP_PROP_FPS, self.fps)
+        if self.mode:
+            # FramePacer decimates from the mode's rate down to self.fps
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.mode["fourcc"].ljust(4)))
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.mode["width"])
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.mode["height"])
+            cap.set(cv2.CAP_PROP_FPS, self.mode["fps"] or self.fps)
+        else:
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'))
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+            cap.set(cv2.CAP_PROP_FPS, self.fps)
         cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
 
+    # ------------------------------------------------------------------
+    # Capture loop
+    # ------------------------------------------------------------------
+
+    def _capture(self, cap):
+        """Run until stop() or the source stops delivering frames."""
         encode_params = [
-            int(cv2.IMWRITE_JPEG_QUALITY), 60,
+            int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality,
             int(cv2.IMWRITE_JPEG_OPTIMIZE), 1,
             int(cv2.IMWRITE_JPEG_PROGRESSIVE), 0,
         ]
 
         frame_count = 0
-        next_frame_time = time.monotonic()
-
-        try:
-            while not self._stop_event.is_set():
-                now = time.monotonic()
-                sleep_for = next_frame_time - now
-                if sleep_for > 0.001:
-                    time.sleep(sleep_for)
-                next_frame_time = time.monotonic() + self.frame_interval
-
-                ret, frame = cap.read()
-                if not ret:
-                    time.sleep(0.02)
-                    continue
-
-                # ---- Motion detection (sampled every Nth frame) ----------
-                motion_detected = self.last_motion_state
-                if self.motion_detector and frame_count % self.motion_check_interval == 0:
-                    motion_detected, frame = self.motion_detector.detect(frame)
-                    self.last_motion_state = motion_detected
-
-                # ---- Overlay for live view ------------------------------
-                display_frame = add_overlay(frame, self.cam_index, motion_detected)
-                
-                # ---- Rolling MP4 recording (raw frame, no overlay) -------
-                self.recorder.write(display_frame)
-                
-                # ---- Snapshot on motion event (raw frame, no overlay) ----
-                self.snapshotter.on_frame(display_frame, motion_detected)
-
-                # ---- Encode and push to frame buffer --------------------
+        last_good = time.monotonic()
+
+        while not self._stop_event.is_set():
+            # grab() blocks until the sensor delivers; no decode happens yet
+            if not cap.grab():
+                if time.monotonic() - last_good > STALL_TIMEOUT:
+                    return
+                time.sleep(0.02)
+                continue
+            last_good = time.monotonic()
+
+            ts = capture_timestamp(cap.get(cv2.CAP_PROP_POS_MSEC))
+            if not self.pacer.should_keep(ts):
+                continue
+
+            # Decode into the same buffer every frame (reallocated only if the
+            # device changes resolution).  Everything downstream either uses
+            # the frame synchronously or copies what it keeps.
+            ret, frame = cap.retrieve(self._frame)
+            if not ret:
+                continue
+            self._frame = frame
+
+            # A native mode larger than requested is captured as-is and
+            # scaled here, so stream, recording and labels all match the
+            # configured width x height
+            if self.mode and (frame.shape[1], frame.shape[0]) != (self.width, self.height):
+                if self._scaled is None:
+                    self._scaled = np.empty((self.height, self.width, 3), np.uint8)
+                frame = cv2.resize(crop_to_aspect(frame, self.width, self.height),
+                                   (self.width, self.height), dst=self._scaled,
+                                   interpolation=cv2.INTER_AREA)
+            captured_at = to_wall_clock(ts)
+            self.recorder.measured_fps = self.pacer.delivered_fps
+
+            # ---- Motion detection (sampled every Nth frame) ----------
+            motion_detected = self.last_motion_state
+            if self.motion_detector and frame_count % self.motion_check_interval == 0:
+                motion_detected, frame = self.motion_detector.detect(frame)
+                self.last_motion_state = motion_detected
+            motion_box = self.motion_detector.motion_box if self.motion_detector else None
+
+            # ---- Second stage: classify motion frames off-thread -----
+            event = motion_detected
+            objects = None
+            if self.classifier:
+                if motion_detected:
+                    self.classifier.submit(frame, motion_box, captured_at)
+                person = self.classifier.confirmed(captured_at)
+                objects = self.classifier.objects if person else []
+                if self.event_trigger == "person":
+                    event = person
+
+            # ---- Metadata side-channel (drawn by the browser) --------
+            metadata_hub.publish(self.cam_index, motion_detected, motion_box, captured_at, objects)
+
+            # ---- Static scene: is this frame worth sending? ----------
+            # Judged on the raw frame so a burned-in clock isn't "change"
+            send = True
+            if self.static_filter:
+                send = self.static_filter.should_send(frame, captured_at, force=motion_detected)
+
+            # ---- Optional burned-in overlay --------------------------
+            display_frame = frame
+            if self.burn_in:
+                add_motion_box(display_frame, motion_box)
+                display_frame = add_overlay(display_frame, self.cam_index, motion_detected)
+            
+            # ---- Encode once for live view and mjpeg recording -------
+            # The encoder's output array is fresh each call, so share it as a
+            # read-only view rather than copying it again with tobytes().
+            # Unchanged frames aren't encoded; an mjpeg recorder encodes the
+            # few it keeps itself.
+            jpeg_bytes = None
+            if send:
                 ret_enc, jpeg = cv2.imencode('.jpg', display_frame, encode_params)
-                if ret_enc:
-                    self.frame_buffer.push(jpeg.tobytes())
+                jpeg_bytes = jpeg.data.toreadonly() if ret_enc else None
+
+            # ---- Rolling recording (raw frame, no overlay) -----------
+            self.recorder.write(display_frame, jpeg_bytes, event, captured_at)
+            
+            # ---- Snapshot on motion event (raw frame, no overlay) ----
+            self.snapshotter.on_frame(display_frame, event, motion_box, captured_at)
 
-                frame_count += 1
+            # ---- Push to frame buffer -------------------------------
+            if jpeg_bytes is not None:
+                self.frame_buffer.push(jpeg_bytes)
 
-        finally:
-            cap.release()
\ No newline at end of file
+            frame_count += 1
@@ -0,0 +1,415 @@
+"""
+relay.py  –  stream/relay.py
+
+Aggregator mode: fill local FrameBuffers from other OptiVue instances.
+
+Each `relay:` entry in config.yaml names a remote node and the cameras to
+pull from it.  A RelayProducer per camera holds one long-lived GET of the
+remote /stream/cam{n}.mjpeg and pushes every JPEG into a local FrameBuffer,
+so however many people watch centrally each remote camera crosses the WAN
+once.  Local clients, the mosaic and the live view fan out from that buffer
+exactly as they do for a local camera.
+
+    relay:
+      - url: http://building-a:5000
+        cameras: [0, 1]        # remote camera indices
+        index_base: 100        # shown locally as cam100, cam101
+
+Remote motion metadata is relayed too: one /events connection per node
+republishes into the local metadata hub under the local indices.
+
+Status polls go through a small pool of persistent HTTP/1.1 connections.
+The long-lived streams (each camera's MJPEG, /events) never complete a
+response, so each holds its own connection and reopens it with
+exponential backoff when the node drops off.
+With `on_demand` (the default) a camera is only pulled while someone is
+watching it.
+
+Run several instances on different ports (each with its own config.yaml)
+to try it on one machine.
+"""
+
+import json
+import time
+import base64
+import socket
+import logging
+import threading
+import http.client
+from typing import Optional
+from urllib.parse import urlsplit
+
+from utils.frame_buffer import get_or_create as get_frame_buffer
+from utils.metadata import hub as metadata_hub
+from stream.produce import BACKOFF_MAX, BACKOFF_MIN
+from utils.capture_state import STATE_LIVE, STATE_RETRYING, STATE_STARTING, STATE_STOPPED
+
+log = logging.getLogger(__name__)
+
+STATE_IDLE = "idle"             # on-demand relay with nobody watching
+READ_TIMEOUT = 10.0             # no bytes from the node for this long -> reconnect
+IDLE_TIMEOUT = 10.0             # on-demand: disconnect this long after the last viewer leaves
+POOL_SIZE = 4
+STATUS_INTERVAL = 15.0          # seconds between polls of the node's /status
+
+
+class ConnectionPool:
+    """
+    Connections to one node.  Only short requests (the /status poll) are
+    pooled: a connection is handed back after a complete response so the
+    next poll skips the TCP (and TLS) handshake.  Streaming responses never
+    finish, so their connections are closed, never reused.
+    """
+
+    def __init__(self, url: str, size: int = POOL_SIZE, timeout: float = READ_TIMEOUT):
+        parts = urlsplit(url)
+        self.scheme = parts.scheme or "http"
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port
+        self.size = size
+        self.timeout = timeout
+        self.headers = {}
+        if parts.username:
+            token = base64.b64encode(f"{parts.username}:{parts.password or ''}".encode()).decode()
+            self.headers["Authorization"] = f"Basic {token}"
+        self._idle: list[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return f"{self.host}:{self.port}" if self.port else self.host
+
+    def acquire(self) -> http.client.HTTPConnection:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self.connect()
+
+    def connect(self) -> http.client.HTTPConnection:
+        """A new, unpooled connection."""
+        cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def release(self, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, path: str) -> tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        """GET `path`; retries once on a fresh connection if a pooled one went stale."""
+        for attempt in range(2):
+            # The retry must not pick another (possibly also stale) pooled one
+            conn = self.connect() if attempt else self.acquire()
+            try:
+                conn.request("GET", path, headers=self.headers)
+                return conn, conn.getresponse()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                if attempt:
+                    raise
+        raise AssertionError("unreachable")
+
+    def get_json(self, path: str):
+        conn, resp = self.request(path)
+        try:
+            body = resp.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            self.release(conn)
+        if resp.status != 200:
+            raise http.client.HTTPException(f"{path}: HTTP {resp.status}")
+        return json.loads(body)
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._idle:
+                conn.close()
+            self._idle.clear()
+
+
+def _abort(conn: Optional[http.client.HTTPConnection]) -> None:
+    """Close a connection another thread may be blocked reading from."""
+    if conn is None:
+        return
+    if conn.sock is not None:
+        try:
+            conn.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    conn.close()
+
+
+def _read_parts(resp: http.client.HTTPResponse):
+    """Yield the JPEG payload of each part of a multipart/x-mixed-replace body."""
+    boundary = b"--frame"
+    content_type = resp.getheader("Content-Type", "")
+    if "boundary=" in content_type:
+        boundary = b"--" + content_type.split("boundary=", 1)[1].strip().strip('"').encode()
+
+    while True:
+        line = resp.readline()
+        if not line:
+            return                              # remote ended the stream
+        if not line.startswith(boundary):
+            continue
+        length = None
+        while True:
+            header = resp.readline()
+            if not header or header in (b"\r\n", b"\n"):
+                break
+            name, _, value = header.decode("latin1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value.strip())
+
+        if length is not None:
+            yield resp.read(length)
+            continue
+
+        # No Content-Length (older OptiVue): the JPEG ends at its EOI marker
+        data = bytearray()
+        while True:
+            line = resp.readline()
+            if not line:
+                return
+            data += line
+            if data.endswith(b"\xff\xd9\r\n"):
+                yield bytes(data[:-2])
+                break
+
+
+class RelayProducer:
+    """
+    Stands in for CameraProducer for one remote camera: same start/stop,
+    `state` and status() so /status and the live view treat it alike.
+    """
+
+    def __init__(self, cam_index: int, remote_index: int, pool: ConnectionPool,
+                 on_demand: bool = True):
+        self.cam_index = cam_index
+        self.remote_index = remote_index
+        self.pool = pool
+        self.on_demand = on_demand
+        self.capabilities = None
+        self.frame_buffer = get_frame_buffer(cam_index)
+
+        self.state = STATE_STARTING
+        self.retries = 0
+        self.last_error = None
+        self.frames = 0
+        self.bytes = 0
+        self.remote_status: Optional[dict] = None   # from the node's /status
+
+        self._conn: Optional[http.client.HTTPConnection] = None
+        self._stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True,
+                                       name=f"relay-cam{cam_index}")
+
+    def start(self):
+        self._stop_event.clear()
+        self.thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        _abort(self._conn)
+        self.thread.join(timeout=5.0)
+        self.frame_buffer.close()
+        self.state = STATE_STOPPED
+
+    def status(self) -> dict:
+        return {
+            "cam":        self.cam_index,
+            "state":      self.state,
+            "retries":    self.retries,
+            "last_error": self.last_error,
+            "remote":     f"{self.pool}/cam{self.remote_index}",
+            "frames":     self.frames,
+            "bytes":      self.bytes,
+            "remote_state": (self.remote_status or {}).get("state"),
+        }
+
+    def stream_info(self) -> dict:
+        """
+        Resolution and frame rate for the live-view label, as the remote
+        node reports them – the local camera profile says nothing about a
+        relayed camera.  Empty until the node's /status has been read.
+        """
+        remote = self.remote_status or {}
+        info = {}
+        if remote.get("resolution"):
+            info["resolution"] = remote["resolution"]
+        if remote.get("fps"):
+            info["framerate"] = remote["fps"]
+        return info
+
+    def _set_state(self, state, error=None):
+        if state != self.state:
+            log.info(f"[relay cam{self.cam_index}] {self.state} -> {state}"
+                     + (f" ({error})" if error else ""))
+        self.state = state
+        if error:
+            self.last_error = error
+
+    def _wanted(self) -> bool:
+        return not self.on_demand or self.frame_buffer.subscribers > 0
+
+    def _run(self):
+        backoff = BACKOFF_MIN
+        while not self._stop_event.is_set():
+            if not self._wanted():
+                self._set_state(STATE_IDLE)
+                self._stop_event.wait(timeout=0.5)
+                continue
+
+            started = time.monotonic()
+            try:
+                self._relay()
+            except (OSError, ValueError, http.client.HTTPException) as exc:
+                if self._stop_event.is_set():
+                    break
+                self.retries += 1
+                self._set_state(STATE_RETRYING, str(exc) or type(exc).__name__)
+                if time.monotonic() - started > BACKOFF_MAX:
+                    backoff = BACKOFF_MIN
+                self._stop_event.wait(timeout=backoff)
+                backoff = min(backoff * 2, BACKOFF_MAX)
+                continue
+            backoff = BACKOFF_MIN
+
+    def _relay(self):
+        """Pull frames until the stream ends, fails, or nobody is watching."""
+        conn, resp = self.pool.request(f"/stream/cam{self.remote_index}.mjpeg")
+        self._conn = conn
+        try:
+            if resp.status != 200:
+                raise http.client.HTTPException(f"HTTP {resp.status}")
+            self._set_state(STATE_LIVE)
+            unwatched_since = None
+            for jpeg_bytes in _read_parts(resp):
+                if self._stop_event.is_set():
+                    return
+                self.frame_buffer.push(jpeg_bytes)
+                self.frames += 1
+                self.bytes += len(jpeg_bytes)
+
+                if self._wanted():
+                    unwatched_since = None
+                elif unwatched_since is None:
+                    unwatched_since = time.monotonic()
+                elif time.monotonic() - unwatched_since > IDLE_TIMEOUT:
+                    return
+            raise http.client.HTTPException("stream ended")
+        finally:
+            self._conn = None
+            conn.close()            # a half-read stream can't be reused
+
+
+class MetadataRelay:
+    """Republishes one node's /events updates into the local metadata hub."""
+
+    def __init__(self, pool: ConnectionPool, index_map: dict[int, int]):
+        self.pool = pool
+        self.index_map = index_map          # remote index -> local index
+        self._conn = None
+        self._stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True,
+                                       name=f"relay-events-{pool.host}")
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        _abort(self._conn)
+        self.thread.join(timeout=5.0)
+
+    def _run(self):
+        backoff = BACKOFF_MIN
+        while not self._stop_event.is_set():
+            try:
+                conn, resp = self.pool.request("/events")
+                self._conn = conn
+                try:
+                    if resp.status != 200:
+                        raise http.client.HTTPException(f"HTTP {resp.status}")
+                    backoff = BACKOFF_MIN
+                    for line in iter(resp.readline, b""):
+                        if self._stop_event.is_set():
+                            return
+                        if line.startswith(b"data:"):
+                            self._publish(json.loads(line[5:]))
+                finally:
+                    self._conn = None
+                    conn.close()
+            except (OSError, ValueError, http.client.HTTPException) as exc:
+                if self._stop_event.is_set():
+                    return
+                log.debug(f"[relay] {self.pool} events: {exc}")
+            self._stop_event.wait(timeout=backoff)
+            backoff = min(backoff * 2, BACKOFF_MAX)
+
+    def _publish(self, updates: list) -> None:
+        for update in updates:
+            local = self.index_map.get(update.get("cam"))
+            if local is not None:
+                metadata_hub.publish(local, update["motion"], update.get("box"), update.get("ts"),
+                                     update.get("objects"))
+
+
+class RelayNode:
+    """All relayed cameras of one remote OptiVue instance, sharing one pool."""
+
+    def __init__(self, url: str, cameras: list[int], index_base: int, on_demand: bool = True):
+        self.url = url
+        self.pool = ConnectionPool(url)
+        self.producers = [
+            RelayProducer(index_base + remote, remote, self.pool, on_demand)
+            for remote in cameras
+        ]
+        self.metadata = MetadataRelay(self.pool, {p.remote_index: p.cam_index for p in self.producers})
+        self._stop_event = threading.Event()
+        self._status_thread = threading.Thread(target=self._poll_status, daemon=True,
+                                               name=f"relay-status-{self.pool.host}")
+
+    def start(self):
+        log.info(f"Relaying {len(self.producers)} camera(s) from {self.url}")
+        for producer in self.producers:
+            producer.start()
+        self.metadata.start()
+        self._status_thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self.metadata.stop()
+        for producer in self.producers:
+            producer.stop()
+        self.pool.close()
+
+    def _poll_status(self):
+        """Track the node's own view of each camera (live / retrying / dead)."""
+        while not self._stop_event.is_set():
+            try:
+                remote = {s["cam"]: s for s in self.pool.get_json("/status")}
+            except (OSError, ValueError, KeyError, TypeError, http.client.HTTPException) as exc:
+                log.debug(f"[relay] {self.pool} status: {exc}")
+                remote = {}
+            for producer in self.producers:
+                producer.remote_status = remote.get(producer.remote_index)
+            self._stop_event.wait(timeout=STATUS_INTERVAL)
+
+
+def build_nodes(config) -> list[RelayNode]:
+    """RelayNodes for every `relay:` entry; local indices default to 100, 200, ..."""
+    nodes = []
+    for i, entry in enumerate(getattr(config, "relay", []) or []):
+        nodes.append(RelayNode(
+            entry["url"],
+            [int(c) for c in entry.get("cameras", [0])],
+            int(entry.get("index_base", 100 * (i + 1))),
+            bool(entry.get("on_demand", True)),
+        ))
+    return nodes
@@ -0,0 +1,39 @@
+"""
+The person detector depends on cv2.HOGDescriptor, which OpenCV 5 moved to
+contrib; requirements.txt pins below 5 and this fails if that slips.
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import classifier
+from utils.classifier import ObjectClassifier
+
+
+class _Config:
+    detection_max_rate = 100
+    detection_hold = 5.0
+    detection_threshold = 0.5
+    detection_workers = 1
+
+
+def test_detector_available():
+    assert classifier.available()
+
+
+def test_classifies_off_the_capture_thread():
+    clf = ObjectClassifier(0, _Config())
+    frame = np.zeros((480, 640, 3), np.uint8)
+    assert clf.submit(frame, [0.25, 0.25, 0.75, 0.75], time.time())
+
+    deadline = time.time() + 10
+    while clf._pending and time.time() < deadline:
+        time.sleep(0.05)
+    assert not clf._pending
+    assert clf.objects == []
+    assert not clf.confirmed()
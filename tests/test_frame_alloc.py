@@ -0,0 +1,116 @@
+"""
+Steady-state allocation of the capture + motion hot loop.
+
+CameraProducer decodes every frame into the previous frame's array
+(cap.retrieve(self._frame)) and MotionDetector reuses its working buffers,
+so after warm-up the loop should not allocate per frame.  tracemalloc sees
+numpy's allocations, so a few thousand frames of per-frame churn would show
+up as megabytes here.
+"""
+
+import os
+import sys
+import tracemalloc
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.motion import MotionDetector
+
+WIDTH, HEIGHT = 640, 480
+FRAMES = 3000
+WARMUP = 50
+# One 640x480 BGR frame is 900 KB; allow far less than a single frame
+MAX_GROWTH = 256 * 1024
+MAX_PEAK = 256 * 1024
+
+
+def _frames(count):
+    """Synthetic frames with a moving block so motion is actually detected."""
+    base = np.full((HEIGHT, WIDTH, 3), 40, np.uint8)
+    for i in range(count):
+        frame = base.copy()
+        x = (i * 7) % (WIDTH - 80)
+        frame[200:280, x:x + 80] = 220
+        yield frame
+
+
+@pytest.fixture(scope="module")
+def clip(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("alloc") / "clip.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 15, (WIDTH, HEIGHT))
+    if not writer.isOpened():
+        pytest.skip("No MJPG writer in this OpenCV build")
+    for frame in _frames(120):
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def test_motion_detect_does_not_allocate_per_frame():
+    detector = MotionDetector(contour_area=500)
+    frames = list(_frames(64))
+    for frame in frames[:WARMUP]:
+        detector.detect(frame)
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        detected = 0
+        for i in range(FRAMES):
+            motion, _ = detector.detect(frames[i % len(frames)])
+            detected += motion
+        current, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    assert detected, "synthetic motion was never detected"
+    growth = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    assert growth < MAX_GROWTH
+    assert current - baseline < MAX_GROWTH
+    assert peak - baseline < MAX_PEAK
+
+
+def test_retrieve_reuses_frame_buffer(clip):
+    cap = cv2.VideoCapture(clip)
+    assert cap.isOpened()
+    detector = MotionDetector(contour_area=500)
+
+    # Same pattern as CameraProducer: decode into the previous frame's array
+    buffer = None
+    for _ in range(WARMUP):
+        assert cap.grab()
+        ret, buffer = cap.retrieve(buffer)
+        assert ret
+        detector.detect(buffer)
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        for _ in range(FRAMES):
+            if not cap.grab():
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                assert cap.grab()
+            ret, frame = cap.retrieve(buffer)
+            assert ret
+            assert frame is buffer or np.shares_memory(frame, buffer)
+            buffer = frame
+            detector.detect(frame)
+        current, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+        cap.release()
+
+    growth = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    assert growth < MAX_GROWTH
+    assert current - baseline < MAX_GROWTH
+    assert peak - baseline < MAX_PEAK
@@ -0,0 +1,50 @@
+"""
+Native mode selection and scaling: a mode that keeps up with the requested
+rate wins over an exact size that can't, and a native mode with a different
+aspect ratio is cropped rather than stretched.
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stream.produce import crop_to_aspect
+from utils.indices import choose_mode
+
+
+def _caps(formats):
+    return {"identity": "test", "formats": formats}
+
+
+def test_prefers_a_mode_that_meets_fps():
+    caps = _caps({"MJPG": {"640x480": [15], "1280x720": [30]}})
+    mode = choose_mode(caps, 640, 480, 30)
+    assert (mode["width"], mode["height"], mode["fps"]) == (1280, 720, 30)
+
+
+def test_smallest_covering_mode_at_full_rate():
+    caps = _caps({"MJPG": {"640x480": [30, 15], "1280x720": [30], "1920x1080": [30]}})
+    mode = choose_mode(caps, 640, 480, 15)
+    assert (mode["width"], mode["height"], mode["fps"]) == (640, 480, 15)
+
+
+def test_falls_back_to_largest_when_nothing_covers():
+    caps = _caps({"YUYV": {"320x240": [30], "640x480": [30, 10]}})
+    mode = choose_mode(caps, 1280, 720, 30)
+    assert (mode["width"], mode["height"]) == (640, 480)
+
+
+def test_crop_keeps_aspect_ratio():
+    frame = np.zeros((720, 1280, 3), np.uint8)
+    frame[:, 160:1120] = 255                    # the centred 4:3 region
+
+    cropped = crop_to_aspect(frame, 640, 480)
+    assert cropped.shape[:2] == (720, 960)
+    assert cropped.min() == 255
+    assert np.shares_memory(cropped, frame)
+
+    assert crop_to_aspect(frame, 1920, 1080).shape[:2] == (720, 1280)
+    assert crop_to_aspect(np.zeros((480, 640, 3), np.uint8), 1280, 720).shape[:2] == (360, 640)
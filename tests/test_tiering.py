@@ -0,0 +1,67 @@
+"""
+Storage tiering must downsample a clip once and then leave it alone, even
+when the source rate doesn't divide evenly by tier_fps.
+"""
+
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.tiering import StorageTiering
+
+
+class _Config:
+    recording_length = 60
+    record_tier_after = 1
+    record_tier_fps = 2
+    record_tier_scale = 0.5
+    record_tier_max_cpu = 101       # never back off for the machine running the tests
+    record_preview_interval = 0     # no preview sidecars
+
+    def __init__(self, storage_path):
+        self.storage_path = storage_path
+
+
+def _write_clip(path, fps, frames=150, size=(640, 480)):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    if not writer.isOpened():
+        pytest.skip("No mp4v writer in this OpenCV build")
+    rng = np.random.default_rng(0)
+    for _ in range(frames):
+        writer.write(rng.integers(0, 255, (size[1], size[0], 3), np.uint8))
+    writer.release()
+    old = time.time() - 3 * 86400
+    os.utime(path, (old, old))
+
+
+def _width(path):
+    cap = cv2.VideoCapture(path)
+    try:
+        return int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), cap.get(cv2.CAP_PROP_FPS)
+    finally:
+        cap.release()
+
+
+@pytest.mark.parametrize("fps", [25.0, 14.87])
+def test_second_pass_leaves_tiered_clip_unchanged(tmp_path, fps):
+    path = str(tmp_path / "cam0_20260101_100000.mp4")
+    _write_clip(path, fps)
+    tiering = StorageTiering(_Config(str(tmp_path)))
+
+    assert tiering.run_pass() == 1
+    width, out_fps = _width(path)
+    assert width == 320
+    assert out_fps <= 2 + 0.01
+    stat = os.stat(path)
+
+    assert tiering.run_pass() == 0
+    assert _width(path)[0] == 320
+    assert os.stat(path).st_size == stat.st_size
+    assert os.stat(path).st_mtime_ns == stat.st_mtime_ns
+    assert tiering.stats()["clips"] == 1
@@ -0,0 +1,12 @@
+"""
+capture_state.py  –  utils/capture_state.py
+
+Capture supervisor states reported by CameraProducer and RelayProducer in
+/status, shared with utils modules that react to them (e.g. tiering).
+"""
+
+STATE_STARTING = "starting"
+STATE_LIVE = "live"
+STATE_RETRYING = "retrying"      # device present but not delivering; backing off
+STATE_DEAD = "dead"              # device node gone; waiting for hot-plug
+STATE_STOPPED = "stopped"
@@ -0,0 +1,203 @@
+"""
+classifier.py  –  utils/classifier.py
+
+Optional second detection stage behind the motion gate.
+
+MotionDetector fires on any pixel change – headlights, shadows, rain.  With
+`detection.enabled`, frames the motion gate flags are also handed to
+OpenCV's built-in HOG people detector, and snapshots, events and recording
+can key on "a person was seen" instead of "something changed"
+(`detection.trigger: person`).
+
+The classifier never runs on the capture thread.  The producer calls
+`submit()`, which copies just the region around the motion box and queues it
+for a small shared worker pool; it returns at once.  Each camera submits at
+most `detection.max_rate` frames per second and never has more than one
+frame queued, so the classifier only costs CPU while there is activity and
+can't fall behind.
+
+    classifier = ObjectClassifier(cam_index, config)
+    if motion_detected:
+        classifier.submit(frame, motion_box, timestamp)
+    person = classifier.confirmed(timestamp)
+"""
+
+import time
+import queue
+import logging
+import threading
+from typing import Optional
+
+import cv2
+
+from utils.housekeeping import lower_priority
+
+log = logging.getLogger(__name__)
+
+LABEL_PERSON = "person"
+_MIN_WINDOW = (64, 128)         # HOG people detector window (w, h)
+_MAX_WIDTH = 400                # crops are scaled down to this before detection
+_PAD = 0.25                     # grow the motion box by this fraction each side
+
+
+def available() -> bool:
+    """The HOG detector ships with OpenCV 4.x (in OpenCV 5 it moved to contrib)."""
+    return hasattr(cv2, "HOGDescriptor")
+
+
+class _ClassifierPool:
+    """Worker threads shared by every camera; each owns its own HOG detector."""
+
+    QUEUE_SIZE = 8
+
+    def __init__(self):
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self._threads: list[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def submit(self, job: tuple, workers: int) -> bool:
+        with self._lock:
+            while len(self._threads) < workers:
+                thread = threading.Thread(target=self._run, daemon=True,
+                                          name=f"classifier-{len(self._threads)}")
+                thread.start()
+                self._threads.append(thread)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            return False
+        return True
+
+    def _run(self) -> None:
+        # Capture and streaming come first
+        lower_priority(5)
+        hog = cv2.HOGDescriptor()
+        hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+        while True:
+            classifier, crop, origin, timestamp = self._queue.get()
+            try:
+                classifier._classify(hog, crop, origin, timestamp)
+            except Exception as exc:
+                log.warning(f"[Classifier cam{classifier.cam_index}] {exc}")
+            finally:
+                classifier._done()
+
+
+_pool = _ClassifierPool()
+
+
+class ObjectClassifier:
+    def __init__(self, cam_index: int, config):
+        self.cam_index = cam_index
+        self.min_interval = 1.0 / max(float(getattr(config, "detection_max_rate", 2.0)), 0.01)
+        self.hold = float(getattr(config, "detection_hold", 5.0))
+        self.threshold = float(getattr(config, "detection_threshold", 0.5))
+        self.workers = max(int(getattr(config, "detection_workers", 1)), 1)
+
+        self._lock = threading.Lock()
+        self._pending = False
+        self._last_submit = 0.0
+        self._last_seen = None          # capture time of the last positive frame
+        self.objects: list[dict] = []   # latest detections, boxes normalised to 0..1
+
+        self.submitted = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.detections = 0
+
+    # ------------------------------------------------------------------
+    # Capture-thread side
+    # ------------------------------------------------------------------
+
+    def submit(self, frame, motion_box: Optional[list], timestamp: float) -> bool:
+        """
+        Queue the motion region of `frame` for classification.  Returns False
+        (without copying anything) when rate-limited or still busy with the
+        previous frame from this camera.
+        """
+        with self._lock:
+            busy = self._pending or timestamp - self._last_submit < self.min_interval
+        if busy:
+            self.skipped += 1
+            return False
+
+        h, w = frame.shape[:2]
+        x1, y1, x2, y2 = motion_box or (0.0, 0.0, 1.0, 1.0)
+        pad_x, pad_y = (x2 - x1) * _PAD, (y2 - y1) * _PAD
+        left, top = max(int((x1 - pad_x) * w), 0), max(int((y1 - pad_y) * h), 0)
+        right, bottom = min(int((x2 + pad_x) * w), w), min(int((y2 + pad_y) * h), h)
+        if right - left < 8 or bottom - top < 8:
+            self.skipped += 1
+            return False
+
+        # The producer reuses its frame buffer, so the worker needs its own copy
+        crop = frame[top:bottom, left:right].copy()
+        with self._lock:
+            self._pending = True
+            self._last_submit = timestamp
+        if not _pool.submit((self, crop, (left, top, w, h), timestamp), self.workers):
+            self._done()
+            self.dropped += 1
+            return False
+        self.submitted += 1
+        return True
+
+    def confirmed(self, now: Optional[float] = None) -> bool:
+        """True if a person was seen within the last `detection.hold` seconds."""
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._last_seen is not None and now - self._last_seen <= self.hold
+
+    def stats(self) -> dict:
+        return {
+            "classified":       self.submitted,
+            "classify_skipped": self.skipped,
+            "classify_dropped": self.dropped,
+            "detections":       self.detections,
+        }
+
+    # ------------------------------------------------------------------
+    # Worker side
+    # ------------------------------------------------------------------
+
+    def _done(self) -> None:
+        """The queued frame has been classified (or dropped)."""
+        with self._lock:
+            self._pending = False
+
+    def _classify(self, hog, crop, origin, timestamp: float) -> None:
+        left, top, frame_w, frame_h = origin
+        ch, cw = crop.shape[:2]
+
+        # Bring the crop into the detector's useful range: at least one
+        # window tall, no wider than _MAX_WIDTH
+        scale = min(_MAX_WIDTH / cw, 1.0)
+        scale = max(scale, _MIN_WINDOW[1] / ch, _MIN_WINDOW[0] / cw)
+        if scale != 1.0:
+            crop = cv2.resize(crop, (max(int(cw * scale), _MIN_WINDOW[0]),
+                                     max(int(ch * scale), _MIN_WINDOW[1])))
+
+        rects, weights = hog.detectMultiScale(crop, winStride=(8, 8), padding=(8, 8), scale=1.05)
+
+        objects = []
+        for (x, y, rw, rh), weight in zip(rects, weights):
+            if float(weight) < self.threshold:
+                continue
+            objects.append({
+                "label": LABEL_PERSON,
+                "score": round(float(weight), 2),
+                "box": [
+                    round((left + x / scale) / frame_w, 4),
+                    round((top + y / scale) / frame_h, 4),
+                    round((left + (x + rw) / scale) / frame_w, 4),
+                    round((top + (y + rh) / scale) / frame_h, 4),
+                ],
+            })
+
+        with self._lock:
+            self.objects = objects
+            if objects:
+                if self._last_seen is None or timestamp - self._last_seen > self.hold:
+                    log.info(f"[Classifier cam{self.cam_index}] Person detected")
+                self._last_seen = timestamp
+                self.detections += 1
@@ -2,6 +2,56 @@ import yaml
 import os
 import threading
 
+# Keys allowed in a per-camera entry of `cameras:` and the ConfigLoader
+# attribute each one overrides.
+PROFILE_KEYS = {
+    "width":               "camera_width",
+    "height":              "camera_height",
+    "fps":                 "camera_fps",
+    "jpeg_quality":        "jpeg_quality",
+    "motion_detection":    "motion_detection",
+    "motion_contour_area": "motion_contour_area",
+    "motion_interval":     "motion_interval",
+    "record":              "record",
+    "record_mode":         "record_mode",
+}
+
+# Values accepted for record.mode (and a camera's record_mode)
+RECORD_MODES = ("continuous", "segmented")
+
+
+class CameraProfile:
+    """
+    One camera's effective settings: its own overrides from config.yaml,
+    falling back to the global ConfigLoader values for everything else.
+    Passed wherever a `config` is expected for a single camera.
+    """
+
+    def __init__(self, cam_index, overrides, defaults):
+        self.cam_index = cam_index
+        self.overrides = overrides
+        self._defaults = defaults
+        for key, attr in PROFILE_KEYS.items():
+            if key in overrides:
+                setattr(self, attr, overrides[key])
+
+    def __getattr__(self, name):
+        # Only called for attributes not overridden above.  Look _defaults up
+        # in __dict__ so a half-built instance (copy, unpickle) raises
+        # AttributeError instead of recursing.
+        defaults = self.__dict__.get("_defaults")
+        if defaults is None:
+            raise AttributeError(name)
+        return getattr(defaults, name)
+
+    def __repr__(self):
+        return (
+            f"<CameraProfile cam{self.cam_index} "
+            f"{self.camera_width}x{self.camera_height}@{self.camera_fps}fps "
+            f"motion={self.motion_detection}>"
+        )
+
+
 class ConfigLoader:
     _instance = None
     _lock = threading.Lock()
@@ -22,8 +72,17 @@ class ConfigLoader:
         with open(self.config_file) as f:
             cfg = yaml.safe_load(f) or {}
 
-        # Cameras
-        self.cameras = [int(c) for c in cfg.get("cameras", [0])]
+        # Cameras - each entry is an index, or a mapping with `index` plus
+        # any PROFILE_KEYS overriding the global camera/record settings
+        self.cameras = []
+        self._overrides = {}
+        for entry in cfg.get("cameras", [0]):
+            if isinstance(entry, dict):
+                index = int(entry["index"])
+                self._overrides[index] = {k: v for k, v in entry.items() if k in PROFILE_KEYS}
+            else:
+                index = int(entry)
+            self.cameras.append(index)
 
         camera = cfg.get("camera", {})
         self.camera_width = camera.get("width", 640)
@@ -32,19 +91,62 @@ class ConfigLoader:
         self.compression = camera.get("compression", "mjpeg")
         self.motion_detection = camera.get("motion_detection", True)
         self.motion_contour_area = camera.get("motion_contour_area", 500)
+        self.motion_interval = int(camera.get("motion_interval", 3))
+        self.jpeg_quality = int(camera.get("jpeg_quality", 60))
+        self.burn_in = camera.get("burn_in", False)
+        self.capability_cache = camera.get("capability_cache", "camera_caps.json")
+        self.suppress_static = camera.get("suppress_static", False)
+        self.static_threshold = float(camera.get("static_threshold", 0.005))
+        self.static_keepalive = float(camera.get("static_keepalive", 1.0))
 
         record = cfg.get("record", {})
         self.record = record.get("enabled", True)
         self.recording_length = record.get("recording_length", 60)
         self.storage_path = record.get("storage_path", "/var/optivue/recordings")
         self.video_retention = float(record.get("video_retention", 30))
+        self.record_mode = record.get("mode", "continuous")
+        self.segment_length = int(record.get("segment_length", 60))
+        self.record_format = record.get("format", "mp4")
+        self.record_transcode = record.get("transcode", False)
+        self.record_idle_fps = float(record.get("idle_fps", 0))
+        self.record_post_roll = float(record.get("post_roll", 10))
+        self.record_preview_interval = float(record.get("preview_interval", 10))
+        self.record_tier_after = float(record.get("tier_after", 0))
+        self.record_tier_fps = float(record.get("tier_fps", 2))
+        self.record_tier_scale = float(record.get("tier_scale", 0.5))
+        self.record_tier_max_cpu = float(record.get("tier_max_cpu", 75))
+
+        snapshot = cfg.get("snapshot", {})
+        self.snapshot_mode = snapshot.get("mode", "first")
+        self.snapshot_burst_count = int(snapshot.get("burst_count", 3))
+        self.snapshot_burst_window = float(snapshot.get("burst_window", 2.0))
+        self.snapshot_quality = int(snapshot.get("quality", 90))
+
+        detection = cfg.get("detection", {})
+        self.detection_enabled = detection.get("enabled", False)
+        self.detection_trigger = detection.get("trigger", "motion")
+        self.detection_max_rate = float(detection.get("max_rate", 2.0))
+        self.detection_hold = float(detection.get("hold", 5.0))
+        self.detection_threshold = float(detection.get("threshold", 0.5))
+        self.detection_workers = int(detection.get("workers", 1))
+
+        # Remote OptiVue instances to relay cameras from (see stream/relay.py)
+        self.relay = cfg.get("relay", []) or []
 
         server = cfg.get("server", {})
         self.server_host = server.get("host", "0.0.0.0")
         self.server_port = server.get("port", 5000)
+        # Serve live streams from separate processes (see web/stream_workers.py)
+        self.server_stream_workers = int(server.get("stream_workers", 0))
+        self.server_stream_port = int(server.get("stream_port", self.server_port + 1))
+        self.server_frame_slot_kb = int(server.get("frame_slot_kb", 2048))
 
         self._refresh_requested = False
 
+    def profile(self, cam_index) -> CameraProfile:
+        """Effective settings for one camera."""
+        return CameraProfile(cam_index, self._overrides.get(cam_index, {}), self)
+
     def request_refresh(self):
         self._refresh_requested = True
         
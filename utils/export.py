@@ -0,0 +1,269 @@
+"""
+export.py  –  utils/export.py
+
+Cuts one camera's footage between two wall-clock times into a single MP4,
+stitching across clip and segment boundaries, and streams it back in chunks.
+
+Two backends:
+
+  ffmpeg  (if on PATH)  – concat demuxer with inpoint/outpoint and `-c copy`,
+                          written as fragmented MP4 straight to stdout.  No
+                          re-encode, and only the bytes covering the range
+                          are read from disk.
+  OpenCV  (fallback)    – seeks into each source, re-encodes only the frames
+                          inside the range to a temporary file, then streams it.
+                          Also used whenever the range includes .mjpg clips.
+                          Nothing is sent until the encode finishes, so these
+                          ranges are capped at OPENCV_MAX_RANGE_SECONDS.
+"""
+
+import os
+import datetime
+import logging
+import shutil
+import subprocess
+import tempfile
+from typing import Iterator, Optional
+
+import cv2
+import numpy as np
+
+from utils import mjpeg_container
+from utils.mjpeg_container import MjpegReader
+from utils.segments import SegmentIndex
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+MAX_RANGE_SECONDS = 6 * 3600
+OPENCV_MAX_RANGE_SECONDS = 10 * 60     # re-encoded before the first byte is sent
+
+
+class ClipExporter:
+    def __init__(self, config):
+        self.config = config
+        self.ffmpeg = shutil.which("ffmpeg")
+
+    # ------------------------------------------------------------------
+    # Source discovery
+    # ------------------------------------------------------------------
+
+    def _probe(self, path: str) -> Optional[float]:
+        """Video duration in seconds, or None if the file isn't readable yet."""
+        cap = cv2.VideoCapture(path)
+        try:
+            if not cap.isOpened():
+                return None
+            frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            return frames / fps if frames > 0 and fps > 0 else None
+        finally:
+            cap.release()
+
+    def _rolling_clips(self, cam_index: int) -> list[dict]:
+        storage = self.config.storage_path
+        prefix = f"cam{cam_index}_"
+        starts = []
+        for fname in os.listdir(storage) if os.path.isdir(storage) else []:
+            base, ext = os.path.splitext(fname)
+            if not (fname.startswith(prefix) and ext in (".mp4", mjpeg_container.EXT)):
+                continue
+            try:
+                ts = datetime.datetime.strptime(base[len(prefix):], "%Y%m%d_%H%M%S")
+            except ValueError:
+                continue
+            starts.append((ts.timestamp(), os.path.join(storage, fname)))
+        starts.sort()
+
+        # A clip ends when it was last written (clips cut short by a restart
+        # end early), and never after the next one starts or past the
+        # configured length.  Transcoding and tiering keep the mtime.
+        clips = []
+        max_len = self.config.recording_length * 60
+        for i, (start, path) in enumerate(starts):
+            try:
+                end = os.path.getmtime(path)
+            except OSError:
+                continue
+            end = min(end, start + max_len)
+            if i + 1 < len(starts):
+                end = min(end, starts[i + 1][0])
+            if end > start:
+                clips.append({"path": path, "start": start, "end": end})
+        return clips
+
+    def _segments(self, cam_index: int, start: float, end: float) -> list[dict]:
+        index = SegmentIndex(self.config.storage_path, cam_index)
+        day = datetime.date.fromtimestamp(start) - datetime.timedelta(days=1)
+        last = datetime.date.fromtimestamp(end)
+        entries = []
+        while day <= last:
+            entries.extend(index.entries(day))
+            day += datetime.timedelta(days=1)
+        return entries
+
+    def sources(self, cam_index: int, start: float, end: float) -> list[dict]:
+        """
+        Every recording overlapping [start, end), oldest first, each with
+        `inpoint`/`outpoint` in video seconds (.mjpg clips get wall-clock
+        `start`/`end` instead).
+        """
+        candidates = self._rolling_clips(cam_index) + self._segments(cam_index, start, end)
+
+        sources = []
+        for src in sorted(candidates, key=lambda s: s["start"]):
+            if src["end"] <= start or src["start"] >= end:
+                continue
+
+            if src["path"].endswith(mjpeg_container.EXT):
+                # Frames carry their own capture times; cut on those directly
+                sources.append({
+                    "path": src["path"],
+                    "start": max(start, src["start"]),
+                    "end": min(end, src["end"]),
+                })
+                continue
+
+            if src.get("frames") and src.get("fps"):
+                duration = src["frames"] / src["fps"]
+            else:
+                duration = self._probe(src["path"])
+            if not duration:
+                continue            # clip still being written
+
+            # Frames are stamped at the nominal fps; map wall time onto video time
+            scale = duration / max(src["end"] - src["start"], 1e-6)
+            sources.append({
+                "path": src["path"],
+                "inpoint": max(start - src["start"], 0) * scale,
+                "outpoint": min(end - src["start"], src["end"] - src["start"]) * scale,
+                "scale": scale,
+                "fps": src.get("fps"),
+            })
+        return sources
+
+    # ------------------------------------------------------------------
+    # Streaming
+    # ------------------------------------------------------------------
+
+    def _use_ffmpeg(self, sources: list[dict]) -> bool:
+        has_mjpeg = any(src["path"].endswith(mjpeg_container.EXT) for src in sources)
+        return bool(self.ffmpeg) and not has_mjpeg
+
+    def max_range(self, sources: list[dict]) -> int:
+        """Longest range, in seconds, the backend for these sources will export."""
+        return MAX_RANGE_SECONDS if self._use_ffmpeg(sources) else OPENCV_MAX_RANGE_SECONDS
+
+    def stream(self, sources: list[dict]) -> Iterator[bytes]:
+        if self._use_ffmpeg(sources):
+            return self._stream_ffmpeg(sources)
+        return self._stream_opencv(sources)
+
+    @staticmethod
+    def _repeats(seconds: float, fps: float, emitted: int) -> int:
+        """
+        How many output frames a source frame `seconds` into the range fills
+        at a fixed `fps`, given `emitted` so far: more than one covers a gap,
+        zero drops a frame that arrived early.
+        """
+        return max(int(seconds * fps) + 1 - emitted, 0)
+
+    def _read_frames(self, src: dict) -> Iterator:
+        """Decoded BGR frames of one source, resampled to the output's fps."""
+        fps = self.config.camera_fps
+        emitted = 0
+
+        if src["path"].endswith(mjpeg_container.EXT):
+            # Frames carry their real capture times
+            for ts, jpeg_bytes in MjpegReader(src["path"]).frames(src["start"], src["end"]):
+                due = self._repeats(ts - src["start"], fps, emitted)
+                if not due:
+                    continue
+                frame = cv2.imdecode(np.frombuffer(jpeg_bytes, np.uint8), cv2.IMREAD_COLOR)
+                if frame is None:
+                    continue
+                for _ in range(due):
+                    yield frame
+                emitted += due
+            return
+
+        # MP4 clips keep whatever rate they were written at (tiered clips
+        # run at tier_fps), so place each frame by the clip's own fps
+        cap = cv2.VideoCapture(src["path"])
+        try:
+            clip_fps = src.get("fps") or cap.get(cv2.CAP_PROP_FPS) or fps
+            scale = src.get("scale") or 1.0
+            cap.set(cv2.CAP_PROP_POS_MSEC, src["inpoint"] * 1000)
+            last = int((src["outpoint"] - src["inpoint"]) * clip_fps)
+            for n in range(last + 1):
+                if not cap.grab():
+                    break
+                due = self._repeats(n / clip_fps / scale, fps, emitted)
+                if not due:
+                    continue            # dropped without decoding
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
+                for _ in range(due):
+                    yield frame
+                emitted += due
+        finally:
+            cap.release()
+
+    def _stream_ffmpeg(self, sources: list[dict]) -> Iterator[bytes]:
+        fd, list_path = tempfile.mkstemp(suffix=".txt", prefix="optivue-export-")
+        with os.fdopen(fd, "w") as fh:
+            for src in sources:
+                escaped = src["path"].replace("'", "'\\''")
+                fh.write(f"file '{escaped}'\n")
+                fh.write(f"inpoint {src['inpoint']:.3f}\n")
+                fh.write(f"outpoint {src['outpoint']:.3f}\n")
+
+        proc = subprocess.Popen(
+            [self.ffmpeg, "-hide_banner", "-loglevel", "error",
+             "-f", "concat", "-safe", "0", "-i", list_path,
+             "-c", "copy", "-movflags", "frag_keyframe+empty_moov",
+             "-f", "mp4", "pipe:1"],
+            stdout=subprocess.PIPE,
+        )
+        try:
+            while True:
+                chunk = proc.stdout.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            # Also runs when the client disconnects mid-download
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+            os.remove(list_path)
+
+    def _stream_opencv(self, sources: list[dict]) -> Iterator[bytes]:
+        fd, out_path = tempfile.mkstemp(suffix=".mp4", prefix="optivue-export-")
+        os.close(fd)
+        try:
+            writer = None
+            size = None
+            for src in sources:
+                for frame in self._read_frames(src):
+                    if writer is None:
+                        size = (frame.shape[1], frame.shape[0])
+                        writer = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*"mp4v"),
+                                                 self.config.camera_fps, size)
+                    if (frame.shape[1], frame.shape[0]) != size:
+                        frame = cv2.resize(frame, size)
+                    writer.write(frame)
+
+            if writer is None:
+                return
+            writer.release()
+
+            with open(out_path, "rb") as fh:
+                while True:
+                    chunk = fh.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+        finally:
+            os.remove(out_path)
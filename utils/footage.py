@@ -3,11 +3,13 @@ import datetime
 import logging
 from collections import defaultdict
 
+from utils.segments import segments_root
+
 log = logging.getLogger(__name__)
 
 class Footage:
     """
-    Scans storage for MP4 and JPEG files, parses timestamps from filenames like:
+    Scans storage for MP4, MJPG and JPEG files, parses timestamps from filenames like:
     cam0_YYYYMMDD_HHMMSS.mp4 or cam0_YYYYMMDD_HHMMSS.jpg
     Returns media grouped by camera.
     """
@@ -19,12 +21,13 @@ class Footage:
     def _parse_filename(self, fname):
         """
         Extracts camera and timestamp from filename.
-        Format: camX_YYYYMMDD_HHMMSS.ext
+        Format: camX_YYYYMMDD_HHMMSS.ext  (or camX_YYYYMMDD_HHMMSS_N.ext)
         """
         try:
             base, ext = os.path.splitext(fname)
             cam, ts_str = base.split("_", 1)  # split at first underscore
-            ts = datetime.datetime.strptime(ts_str, "%Y%m%d_%H%M%S")
+            # Burst snapshots carry a _N suffix after the timestamp
+            ts = datetime.datetime.strptime(ts_str[:15], "%Y%m%d_%H%M%S")
             return cam, ts
         except Exception as e:
             log.warning(f"Failed to parse timestamp from {fname}: {e}")
@@ -47,7 +50,35 @@ class Footage:
         return media_map
 
     def get_clips(self):
-        return self._scan_dir(self.storage_path, ".mp4")
+        return self._scan_dir(self.storage_path, (".mp4", ".mjpg"))
+
+    def get_segments(self):
+        """Segmented recordings, one entry per segment (the page paginates them)."""
+        media_map = defaultdict(list)
+        root = segments_root(self.storage_path)
+        if not os.path.isdir(root):
+            return media_map
+
+        for cam_dir in os.listdir(root):
+            if not os.path.isdir(os.path.join(root, cam_dir)):
+                continue
+            for day in os.listdir(os.path.join(root, cam_dir)):
+                day_dir = os.path.join(root, cam_dir, day)
+                if not os.path.isdir(day_dir):
+                    continue
+                for fname in os.listdir(day_dir):
+                    if not fname.endswith((".mp4", ".mjpg")):
+                        continue
+                    cam, ts = self._parse_filename(fname)
+                    if cam and ts:
+                        media_map[cam_dir].append({
+                            "filename": f"segments/{cam_dir}/{day}/{fname}",
+                            "timestamp": ts,
+                        })
+
+        for cam in media_map:
+            media_map[cam].sort(key=lambda x: x["timestamp"], reverse=True)
+        return media_map
 
     def get_snapshots(self):
         snap_dir = os.path.join(self.storage_path, "snapshots")
@@ -62,6 +93,8 @@ class Footage:
         }
         """
         clips = self.get_clips()
+        for cam, segments in self.get_segments().items():
+            clips[cam] = sorted(clips[cam] + segments, key=lambda x: x["timestamp"], reverse=True)
         snaps = self.get_snapshots()
         cameras = {}
         all_cams = set(list(clips.keys()) + list(snaps.keys()))
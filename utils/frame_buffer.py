@@ -4,15 +4,24 @@ frame_buffer.py  –  utils/frame_buffer.py
 Replaces named pipes with a thread-safe in-memory frame store.
 
 Each camera gets one FrameBuffer instance. The producer writes the latest
-JPEG bytes into it; any number of streaming clients read from it independently
+JPEG (bytes or a read-only memoryview of the encoder output) into it; any number of streaming clients read from it independently
 via `subscribe()`, which returns a generator that yields new frames as they
 arrive.  No byte-splitting, no race conditions.
+
+With `server.stream_workers` the registry hands out SharedFrameBuffers
+instead: they behave the same in-process, and also publish every frame to a
+shared-memory ring that stream worker processes read through `attach()`.
 """
 
+import struct
+import logging
 import threading
 import time
+from multiprocessing import shared_memory
 from typing import Optional
 
+log = logging.getLogger(__name__)
+
 
 class FrameBuffer:
     """
@@ -28,6 +37,7 @@ class FrameBuffer:
         self._lock = threading.Condition()
         self._frame_number: int = 0          # increments on every new frame
         self._closed: bool = False
+        self._subscribers: int = 0           # live subscribe() generators
 
     # ------------------------------------------------------------------
     # Producer side
@@ -40,6 +50,19 @@ class FrameBuffer:
             self._frame_number += 1
             self._lock.notify_all()          # wake all waiting subscribers
 
+    def retain(self) -> None:
+        """
+        Count a reader that polls `latest` instead of iterating subscribe()
+        (e.g. a mosaic compositor) as a subscriber, so on-demand sources such
+        as relays keep delivering frames for it.  Pair with `release()`.
+        """
+        with self._lock:
+            self._subscribers += 1
+
+    def release(self) -> None:
+        with self._lock:
+            self._subscribers -= 1
+
     def close(self) -> None:
         """Signal all subscribers that the stream has ended."""
         with self._lock:
@@ -59,31 +82,239 @@ class FrameBuffer:
         check liveness and bail out if the client has disconnected.
         """
         last_seen = -1
-        while True:
-            with self._lock:
-                # Wait until there is a frame we haven't seen yet
-                deadline = time.monotonic() + timeout
-                while self._frame_number == last_seen and not self._closed:
-                    remaining = deadline - time.monotonic()
-                    if remaining <= 0:
-                        yield None          # timeout – let caller decide
-                        deadline = time.monotonic() + timeout
-                        continue
-                    self._lock.wait(timeout=remaining)
+        with self._lock:
+            self._subscribers += 1
+        try:
+            while True:
+                with self._lock:
+                    # Wait until there is a frame we haven't seen yet
+                    deadline = time.monotonic() + timeout
+                    while self._frame_number == last_seen and not self._closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            yield None          # timeout – let caller decide
+                            deadline = time.monotonic() + timeout
+                            continue
+                        self._lock.wait(timeout=remaining)
 
-                if self._closed:
-                    return
+                    if self._closed:
+                        return
 
-                last_seen = self._frame_number
-                frame = self._frame
+                    last_seen = self._frame_number
+                    frame = self._frame
 
-            yield frame
+                yield frame
+        finally:
+            with self._lock:
+                self._subscribers -= 1
 
     @property
     def latest(self) -> Optional[bytes]:
         """Return the most-recent frame without blocking (may be None)."""
         return self._frame
 
+    @property
+    def frame_number(self) -> int:
+        """Sequence number of the most-recent frame (0 before the first push)."""
+        return self._frame_number
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def subscribers(self) -> int:
+        """Number of clients currently iterating `subscribe()`."""
+        return self._subscribers
+
+
+# ------------------------------------------------------------------
+# Shared memory – capture and web serving in separate processes
+# ------------------------------------------------------------------
+#
+# Segment layout:
+#   header    sequence (u64), closed (u32), slots (u32), slot_size (u64)
+#   readers   MAX_READERS x u32 – subscriber count of each worker process
+#   table     slots x (sequence u64, length u64)
+#   data      slots x slot_size, starting on a 64-byte boundary
+#
+# Frame n goes to slot n % slots.  The writer zeroes the slot's sequence,
+# copies the JPEG in, then stamps the slot and finally the header with n.
+# A reader copies the slot out and accepts it only if the slot still holds
+# n afterwards, so it never returns a frame the writer overwrote mid-copy.
+
+SHM_SLOTS = 4
+MAX_READERS = 16
+POLL_INTERVAL = 0.005           # seconds between sequence checks in a reader
+IDLE_POLL_INTERVAL = 0.25       # ... while the reader's process has no viewers
+
+_HEADER = struct.Struct("<QIIQ")
+_READERS = struct.Struct(f"<{MAX_READERS}I")
+_SLOT = struct.Struct("<QQ")
+
+
+def _layout(slots: int) -> tuple[int, int]:
+    """Byte offsets of the slot table and of the first data slot."""
+    table = _HEADER.size + _READERS.size
+    data = (table + slots * _SLOT.size + 63) // 64 * 64
+    return table, data
+
+
+class SharedFrameBuffer(FrameBuffer):
+    """
+    FrameBuffer that also publishes each frame to a named shared-memory ring.
+
+    Local subscribers are served exactly as by FrameBuffer; `subscribers`
+    also counts viewers in attached worker processes, so on-demand relays
+    keep pulling while anyone, anywhere, is watching.
+    """
+
+    def __init__(self, cam_index: int, name: str, slot_size: int, slots: int = SHM_SLOTS):
+        super().__init__(cam_index)
+        self.name = name
+        self.slots = slots
+        self.slot_size = slot_size
+        self._table, self._data = _layout(slots)
+        size = self._data + slots * slot_size
+        try:
+            self._shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a run that crashed before closing it
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name, create=True, size=size)
+        _HEADER.pack_into(self._shm.buf, 0, 0, 0, slots, slot_size)
+        self._oversize_warned = False
+
+    def push(self, jpeg_bytes: bytes) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._frame = jpeg_bytes
+            self._frame_number += 1
+            self._publish(self._frame_number, jpeg_bytes)
+            self._lock.notify_all()
+
+    def _publish(self, number: int, jpeg_bytes) -> None:
+        view = memoryview(jpeg_bytes).cast("B")
+        length = view.nbytes
+        if length > self.slot_size:
+            if not self._oversize_warned:
+                log.warning(f"[FrameBuffer cam{self.cam_index}] {length // 1024} KB frame exceeds "
+                            f"the {self.slot_size // 1024} KB shared slot - raise server.frame_slot_kb")
+                self._oversize_warned = True
+            return
+
+        buf = self._shm.buf
+        slot = number % self.slots
+        entry = self._table + slot * _SLOT.size
+        start = self._data + slot * self.slot_size
+        _SLOT.pack_into(buf, entry, 0, 0)
+        buf[start:start + length] = view
+        _SLOT.pack_into(buf, entry, number, length)
+        struct.pack_into("<Q", buf, 0, number)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            struct.pack_into("<I", self._shm.buf, 8, 1)
+        super().close()
+        # Attached readers keep their mapping until they close it themselves
+        self._shm.close()
+        self._shm.unlink()
+
+    @property
+    def subscribers(self) -> int:
+        if self._closed:
+            return self._subscribers
+        return self._subscribers + sum(_READERS.unpack_from(self._shm.buf, _HEADER.size))
+
+
+class AttachedFrameBuffer(FrameBuffer):
+    """
+    Read side of a SharedFrameBuffer, in a stream worker process.
+
+    One thread per camera polls the ring's sequence counter and, while this
+    process has viewers, copies each new frame out once and fans it out to
+    them through the ordinary subscribe().  The same thread publishes this
+    process's subscriber count – including readers that `retain()` the
+    buffer, like the mosaic compositor – to the owner, so on-demand relays
+    in the capture process run for worker-side mosaic viewers too.  With
+    no viewers it only checks in every IDLE_POLL_INTERVAL, so idle workers
+    cost next to nothing.
+    """
+
+    def __init__(self, cam_index: int, name: str, reader_id: int):
+        super().__init__(cam_index)
+        self.name = name
+        self.reader_id = reader_id
+        # Workers are started by the capture process, so this registration
+        # lands in its resource tracker, which the owner's unlink() clears
+        self._shm = shared_memory.SharedMemory(name)
+        _, _, self.slots, self.slot_size = _HEADER.unpack_from(self._shm.buf, 0)
+        self._table, self._data = _layout(self.slots)
+        self._thread = threading.Thread(target=self._follow, daemon=True,
+                                        name=f"shm-reader-cam{cam_index}")
+        self._thread.start()
+
+    def _sequence(self) -> tuple[int, bool]:
+        number, closed, _, _ = _HEADER.unpack_from(self._shm.buf, 0)
+        return number, bool(closed)
+
+    def _read(self, number: int) -> Optional[bytes]:
+        buf = self._shm.buf
+        for _ in range(3):
+            entry = self._table + (number % self.slots) * _SLOT.size
+            slot_number, length = _SLOT.unpack_from(buf, entry)
+            if slot_number == number and number:
+                start = self._data + (number % self.slots) * self.slot_size
+                frame = bytes(buf[start:start + length])
+                if _SLOT.unpack_from(buf, entry)[0] == number:
+                    return frame
+            # Overwritten while copying - take whatever is newest now
+            number, _ = self._sequence()
+        return None
+
+    def _follow(self) -> None:
+        last = 0
+        while True:
+            number, closed = self._sequence()
+            if closed:
+                self.close()
+                return
+            with self._lock:
+                subscribers = self._subscribers
+            struct.pack_into("<I", self._shm.buf, _HEADER.size + 4 * self.reader_id, subscribers)
+
+            if subscribers and number != last:
+                frame = self._read(number)
+                if frame is not None:
+                    last = number
+                    with self._lock:
+                        self._frame = frame
+                        self._frame_number = number
+                        self._lock.notify_all()
+            time.sleep(POLL_INTERVAL if subscribers else IDLE_POLL_INTERVAL)
+
+    def close(self) -> None:
+        super().close()
+        self._shm.close()
+
+    @property
+    def latest(self) -> Optional[bytes]:
+        if self._closed:
+            return self._frame
+        number, _ = self._sequence()
+        if number == self._frame_number:
+            return self._frame
+        return self._read(number)
+
+    @property
+    def frame_number(self) -> int:
+        return self._frame_number if self._closed else self._sequence()[0]
+
 
 # ------------------------------------------------------------------
 # Registry – one global dict indexed by camera index
@@ -91,15 +322,39 @@ class FrameBuffer:
 
 _registry: dict[int, FrameBuffer] = {}
 _registry_lock = threading.Lock()
+_shared: Optional[tuple[str, int]] = None     # (name prefix, slot size) – see use_shared_memory()
+
+
+def use_shared_memory(prefix: str, slot_size: int) -> None:
+    """Make get_or_create() hand out SharedFrameBuffers named <prefix>_cam<n>."""
+    global _shared
+    _shared = (prefix, slot_size)
 
 
 def get_or_create(cam_index: int) -> FrameBuffer:
     with _registry_lock:
         if cam_index not in _registry:
-            _registry[cam_index] = FrameBuffer(cam_index)
+            if _shared is not None:
+                prefix, slot_size = _shared
+                _registry[cam_index] = SharedFrameBuffer(cam_index, f"{prefix}_cam{cam_index}", slot_size)
+            else:
+                _registry[cam_index] = FrameBuffer(cam_index)
         return _registry[cam_index]
 
 
+def attach(cam_index: int, name: str, reader_id: int) -> FrameBuffer:
+    """Register the read side of another process's SharedFrameBuffer."""
+    with _registry_lock:
+        _registry[cam_index] = AttachedFrameBuffer(cam_index, name, reader_id)
+        return _registry[cam_index]
+
+
+def shared_names() -> dict[int, str]:
+    """Shared-memory segment name of every shared buffer, by camera index."""
+    with _registry_lock:
+        return {i: buf.name for i, buf in _registry.items() if isinstance(buf, SharedFrameBuffer)}
+
+
 def get(cam_index: int) -> Optional[FrameBuffer]:
     return _registry.get(cam_index)
 
@@ -0,0 +1,90 @@
+"""
+hotplug.py  –  utils/hotplug.py
+
+Watches /dev for video devices appearing and disappearing so a producer
+whose camera was unplugged can sleep until it comes back instead of polling.
+
+    from utils.hotplug import watcher
+    watcher.watch(cam_index, callback)      # callback(cam_index, present)
+
+Uses watchdog's inotify observer.  If /dev can't be watched (non-Linux, no
+permission) `watch()` still succeeds and producers fall back to polling
+`device_present()` on a slow timer.
+"""
+
+import os
+import re
+import threading
+import logging
+from collections import defaultdict
+from typing import Callable
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+log = logging.getLogger(__name__)
+
+DEV_DIR = "/dev"
+_VIDEO_RE = re.compile(r"^video(\d+)$")
+
+
+def device_path(cam_index: int) -> str:
+    return os.path.join(DEV_DIR, f"video{cam_index}")
+
+
+def device_present(cam_index: int) -> bool:
+    """True if the device node exists (always True where there is no /dev)."""
+    if not os.path.isdir(DEV_DIR):
+        return True
+    return os.path.exists(device_path(cam_index))
+
+
+class DeviceWatcher(FileSystemEventHandler):
+    def __init__(self):
+        super().__init__()
+        self._callbacks: dict[int, list[Callable[[int, bool], None]]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self._observer = None
+        self.available = False
+
+    def watch(self, cam_index: int, callback: Callable[[int, bool], None]) -> None:
+        with self._lock:
+            self._callbacks[cam_index].append(callback)
+            if self._observer is None:
+                self._start()
+
+    def unwatch(self, cam_index: int, callback: Callable[[int, bool], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks.get(cam_index, []):
+                self._callbacks[cam_index].remove(callback)
+
+    def _start(self) -> None:
+        self._observer = Observer()
+        try:
+            self._observer.schedule(self, DEV_DIR, recursive=False)
+            self._observer.daemon = True
+            self._observer.start()
+            self.available = True
+            log.info(f"Watching {DEV_DIR} for camera hot-plug events")
+        except Exception as exc:
+            log.warning(f"Hot-plug detection unavailable ({exc}); falling back to polling")
+
+    def _dispatch(self, path: str, present: bool) -> None:
+        match = _VIDEO_RE.match(os.path.basename(path))
+        if not match:
+            return
+        cam_index = int(match.group(1))
+        log.info(f"{path} {'appeared' if present else 'disappeared'}")
+        with self._lock:
+            callbacks = list(self._callbacks.get(cam_index, []))
+        for callback in callbacks:
+            callback(cam_index, present)
+
+    def on_created(self, event):
+        self._dispatch(event.src_path, True)
+
+    def on_deleted(self, event):
+        self._dispatch(event.src_path, False)
+
+
+watcher = DeviceWatcher()
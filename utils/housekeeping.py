@@ -0,0 +1,69 @@
+"""
+housekeeping.py  –  utils/housekeeping.py
+
+Shared plumbing for the background jobs that rewrite recordings after the
+fact (mjpeg transcoding, preview sprites, storage tiering).
+
+    worker = BackgroundWorker("preview-builder", build_one)
+    worker.submit(path, interval)       # returns at once; runs at nice 19
+
+    replace_keeping_mtime(tmp_path, original_path, final_path)
+"""
+
+import os
+import queue
+import logging
+import threading
+from typing import Callable, Optional
+
+log = logging.getLogger(__name__)
+
+
+def lower_priority(niceness: int = 19) -> None:
+    """Lower the calling thread's CPU priority (on Linux nice() is per-thread)."""
+    os.nice(niceness)
+
+
+class BackgroundWorker:
+    """
+    One low-priority thread, started on first use, that runs `handler(*job)`
+    for each submitted job in order.  Jobs are processed one at a time so the
+    work never competes with capture for more than one core.
+    """
+
+    def __init__(self, name: str, handler: Callable, niceness: int = 19):
+        self.name = name
+        self.handler = handler
+        self.niceness = niceness
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, *job) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name=self.name)
+                self._thread.start()
+        self._queue.put(job)
+
+    def _run(self) -> None:
+        lower_priority(self.niceness)
+        while True:
+            job = self._queue.get()
+            try:
+                self.handler(*job)
+            except Exception as exc:
+                log.warning(f"[{self.name}] {job[0] if job else ''}: {exc}")
+
+
+def replace_keeping_mtime(new_path: str, original_path: str, final_path: Optional[str] = None) -> str:
+    """
+    Move a rewritten clip into place (over `original_path`, or to
+    `final_path`) with the original's mtime, so retention, tiering and
+    export still age and place it by when it was recorded.
+    """
+    mtime = os.path.getmtime(original_path)
+    os.utime(new_path, (mtime, mtime))
+    final_path = final_path or original_path
+    os.replace(new_path, final_path)
+    return final_path
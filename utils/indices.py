@@ -1,24 +1,335 @@
-import cv2
+"""
+indices.py  –  utils/indices.py
+
+Camera discovery and capability probing.
+
+`probe_all()` looks at every video device at once, one thread per device,
+and records the pixel formats, frame sizes and frame rates each supports:
+
+    {
+      "identity": "046d:0825:8A3C1F50",
+      "name":     "UVC Camera (046d:0825)",
+      "formats":  {"MJPG": {"1280x720": [30, 15], "640x480": [30, 15]},
+                   "YUYV": {"640x480": [30, 15], ...}},
+    }
+
+Results are cached in a JSON file keyed by device identity (USB
+vendor:product:serial, or card name and bus when there is no serial), so a
+later startup only has to read each device's identity – a single ioctl – and
+skips enumeration entirely.  `choose_mode()` then picks a mode the sensor
+delivers natively for a requested width/height/fps.
+
+Enumeration uses the V4L2 ioctls directly.  Where those aren't available
+(non-Linux) it falls back to opening the device with OpenCV, which confirms
+the camera works but can only report the mode the driver settles on.
+"""
+
 import os
+import ctypes
+import fcntl
+import json
+import logging
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
-def detect_cameras(max_index=10):
-    cameras = []
-    for i in range(max_index):
-        cap = cv2.VideoCapture(i)
-        if not cap or not cap.isOpened():
+import cv2
+
+log = logging.getLogger(__name__)
+
+CACHE_FILE = "camera_caps.json"
+
+# Formats OpenCV can decode from a V4L2 capture, best first
+PREFERRED_FORMATS = ("MJPG", "YUYV")
+
+# Sizes tried inside a stepwise/continuous frame-size range
+_COMMON_SIZES = [(320, 240), (640, 480), (800, 600), (854, 480), (1024, 768),
+                 (1280, 720), (1280, 960), (1920, 1080)]
+
+_cache_lock = threading.Lock()
+
+
+# ----------------------------------------------------------------------
+# V4L2 ioctls
+# ----------------------------------------------------------------------
+
+def _iowr(nr: int, size: int, read_only: bool = False) -> int:
+    direction = 2 if read_only else 3
+    return (direction << 30) | (size << 16) | (ord("V") << 8) | nr
+
+
+_CAPABILITY = struct.Struct("<16s32s32sIII12x")                # v4l2_capability
+_FMTDESC = struct.Struct("<III32sII12x")                       # v4l2_fmtdesc
+_FRMSIZE = struct.Struct("<III6I8x")                           # v4l2_frmsizeenum
+_FRMIVAL = struct.Struct("<IIIII6I8x")                         # v4l2_frmivalenum
+
+VIDIOC_QUERYCAP = _iowr(0, _CAPABILITY.size, read_only=True)
+VIDIOC_ENUM_FMT = _iowr(2, _FMTDESC.size)
+VIDIOC_ENUM_FRAMESIZES = _iowr(74, _FRMSIZE.size)
+VIDIOC_ENUM_FRAMEINTERVALS = _iowr(75, _FRMIVAL.size)
+
+_BUF_TYPE_VIDEO_CAPTURE = 1
+_CAP_VIDEO_CAPTURE = 0x00000001
+_CAP_DEVICE_CAPS = 0x80000000
+_FRMTYPE_DISCRETE = 1
+
+
+def _ioctl(fd: int, request: int, fmt: struct.Struct, *fields) -> Optional[tuple]:
+    buf = ctypes.create_string_buffer(fmt.pack(*fields), fmt.size)
+    try:
+        fcntl.ioctl(fd, request, buf)
+    except OSError:
+        return None             # EINVAL marks the end of an enumeration
+    return fmt.unpack(buf.raw)
+
+
+def _fourcc(code: int) -> str:
+    return code.to_bytes(4, "little").decode("ascii", "replace").strip("\0 ")
+
+
+def _sysfs_usb_id(cam_index: int) -> Optional[str]:
+    """vendor:product[:serial] of the USB device behind /dev/videoN, if any."""
+    device = os.path.realpath(f"/sys/class/video4linux/video{cam_index}/device")
+    # The video node hangs off a USB interface; the IDs live on its parent
+    for path in (device, os.path.dirname(device)):
+        try:
+            with open(os.path.join(path, "idVendor")) as fh:
+                vendor = fh.read().strip()
+            with open(os.path.join(path, "idProduct")) as fh:
+                product = fh.read().strip()
+        except OSError:
             continue
+        try:
+            with open(os.path.join(path, "serial")) as fh:
+                return f"{vendor}:{product}:{fh.read().strip()}"
+        except OSError:
+            return f"{vendor}:{product}"
+    return None
 
-        ret, frame = cap.read()
-        if ret and frame is not None:
-            cameras.append(i)
 
+def _query(fd: int) -> Optional[tuple[str, str, bool]]:
+    """(card name, bus info, is a capture node), or None if V4L2 isn't there."""
+    cap = _ioctl(fd, VIDIOC_QUERYCAP, _CAPABILITY, b"", b"", b"", 0, 0, 0)
+    if cap is None:
+        return None
+    _, card, bus_info, _, caps, device_caps = cap
+    # UVC cameras also expose metadata-only nodes; those aren't captures
+    effective = device_caps if caps & _CAP_DEVICE_CAPS else caps
+    return (card.split(b"\0", 1)[0].decode(errors="replace"),
+            bus_info.split(b"\0", 1)[0].decode(errors="replace"),
+            bool(effective & _CAP_VIDEO_CAPTURE))
+
+
+def _frame_rates(fd: int, pixelformat: int, width: int, height: int) -> list[float]:
+    rates = set()
+    index = 0
+    while True:
+        ival = _ioctl(fd, VIDIOC_ENUM_FRAMEINTERVALS, _FRMIVAL,
+                      index, pixelformat, width, height, 0, *([0] * 6))
+        if ival is None:
+            break
+        ival_type, num, den = ival[4], ival[5], ival[6]
+        if ival_type == _FRMTYPE_DISCRETE:
+            if num:
+                rates.add(round(den / num, 2))
+        else:
+            # Stepwise/continuous: report the fastest and slowest ends
+            max_num, max_den = ival[7], ival[8]
+            if num:
+                rates.add(round(den / num, 2))
+            if max_num:
+                rates.add(round(max_den / max_num, 2))
+            break
+        index += 1
+    return sorted(rates, reverse=True)
+
+
+def _frame_sizes(fd: int, pixelformat: int) -> list[tuple[int, int]]:
+    sizes = []
+    index = 0
+    while True:
+        size = _ioctl(fd, VIDIOC_ENUM_FRAMESIZES, _FRMSIZE, index, pixelformat, 0, *([0] * 6))
+        if size is None:
+            break
+        if size[2] == _FRMTYPE_DISCRETE:
+            sizes.append((size[3], size[4]))
+        else:
+            min_w, max_w, _, min_h, max_h, _ = size[3:9]
+            sizes.extend((w, h) for w, h in _COMMON_SIZES
+                         if min_w <= w <= max_w and min_h <= h <= max_h)
+            break
+        index += 1
+    return sizes
+
+
+def _probe_v4l2(fd: int, card: str) -> dict:
+    formats = {}
+    index = 0
+    while True:
+        desc = _ioctl(fd, VIDIOC_ENUM_FMT, _FMTDESC, index, _BUF_TYPE_VIDEO_CAPTURE, 0, b"", 0, 0)
+        if desc is None:
+            break
+        pixelformat = desc[4]
+        modes = {}
+        for width, height in _frame_sizes(fd, pixelformat):
+            modes[f"{width}x{height}"] = _frame_rates(fd, pixelformat, width, height)
+        if modes:
+            formats[_fourcc(pixelformat)] = modes
+        index += 1
+    return {"name": card, "formats": formats}
+
+
+def _probe_opencv(cam_index: int) -> Optional[dict]:
+    """Fallback: confirm the camera delivers frames and note the mode it picked."""
+    cap = cv2.VideoCapture(cam_index)
+    try:
+        if not cap or not cap.isOpened():
+            return None
+        ret, frame = cap.read()
+        if not ret or frame is None:
+            return None
+        height, width = frame.shape[:2]
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0
+        fourcc = _fourcc(int(cap.get(cv2.CAP_PROP_FOURCC))) or "MJPG"
+        return {
+            "identity": f"index{cam_index}",
+            "name": f"Camera {cam_index}",
+            "formats": {fourcc: {f"{width}x{height}": [round(fps, 2)] if fps > 0 else []}},
+        }
+    finally:
         cap.release()
 
+
+# ----------------------------------------------------------------------
+# Probing with cache
+# ----------------------------------------------------------------------
+
+def _load_cache(cache_file: str) -> dict:
+    try:
+        with open(cache_file) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache_file: str, cache: dict) -> None:
+    tmp = cache_file + ".tmp"
+    try:
+        with open(tmp, "w") as fh:
+            json.dump(cache, fh, indent=2, sort_keys=True)
+        os.replace(tmp, cache_file)
+    except OSError as exc:
+        log.warning(f"Could not write camera capability cache {cache_file}: {exc}")
+
+
+def _examine(cam_index: int, cache: dict, refresh: bool) -> Optional[dict]:
+    """Capabilities of one device, from the cache when its identity is known."""
+    path = f"/dev/video{cam_index}"
+    try:
+        fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+    except OSError:
+        fd = None
+
+    if fd is None:
+        if os.path.isdir("/dev"):
+            return None
+        caps = cache.get(f"index{cam_index}")
+        return caps if caps and not refresh else _probe_opencv(cam_index)
+
+    try:
+        queried = _query(fd)
+        if queried is None:
+            return _probe_opencv(cam_index)
+        card, bus_info, is_capture = queried
+        if not is_capture:
+            return None
+        identity = _sysfs_usb_id(cam_index) or f"{card}@{bus_info}"
+
+        if not refresh and identity in cache:
+            return cache[identity]
+
+        log.info(f"Probing {path} ({card})")
+        caps = _probe_v4l2(fd, card)
+        caps["identity"] = identity
+        return caps
+    finally:
+        os.close(fd)
+
+
+def probe_all(max_index: int = 10, cache_file: str = CACHE_FILE, refresh: bool = False) -> dict[int, dict]:
+    """
+    Capabilities of every camera with index < max_index, probed in parallel.
+    Devices already in the cache are not enumerated again unless `refresh`.
+    """
+    with _cache_lock:
+        cache = _load_cache(cache_file)
+
+        with ThreadPoolExecutor(max_workers=max_index, thread_name_prefix="probe") as pool:
+            results = pool.map(lambda i: (i, _examine(i, cache, refresh)), range(max_index))
+            found = {i: caps for i, caps in results if caps}
+
+        updated = dict(cache)
+        for caps in found.values():
+            updated[caps["identity"]] = caps
+        if updated != cache:
+            _save_cache(cache_file, updated)
+
+    for cam_index, caps in sorted(found.items()):
+        modes = sum(len(sizes) for sizes in caps["formats"].values())
+        log.info(f"Camera {cam_index}: {caps['name']} [{caps['identity']}], {modes} modes")
+    return found
+
+
+def native_sizes(caps: Optional[dict]) -> list[str]:
+    """"WxH" sizes the camera delivers in a decodable format, smallest first."""
+    if not caps:
+        return []
+    formats = caps.get("formats", {})
+    usable = [f for f in PREFERRED_FORMATS if f in formats] or list(formats)
+    sizes = {size for fmt in usable for size in formats[fmt]}
+    return sorted(sizes, key=lambda s: tuple(int(v) for v in s.split("x"))[::-1])
+
+
+def choose_mode(caps: Optional[dict], width: int, height: int, fps: float) -> Optional[dict]:
+    """
+    Best native mode for a requested size and rate: the smallest size that
+    covers the request (else the largest there is), at a rate that meets
+    `fps` if any such size does – a larger mode at full rate beats an exact
+    size that can't keep up – then the slowest rate that still meets `fps`
+    (else the fastest), preferring MJPG over YUYV.
+    Returns {"fourcc", "width", "height", "fps"} or None if nothing is known.
+    """
+    if not caps or not caps.get("formats"):
+        return None
+    formats = caps["formats"]
+    ranked = [f for f in PREFERRED_FORMATS if f in formats] or list(formats)
+
+    best = None
+    for rank, fourcc in enumerate(ranked):
+        for size, rates in formats[fourcc].items():
+            w, h = (int(v) for v in size.split("x"))
+            covers = w >= width and h >= height
+            fast_enough = [r for r in rates if r >= fps]
+            rate = min(fast_enough) if fast_enough else max(rates, default=0)
+            key = (
+                not covers,
+                not fast_enough,
+                w * h if covers else -w * h,
+                rank,
+            )
+            if best is None or key < best[0]:
+                best = (key, {"fourcc": fourcc, "width": w, "height": h, "fps": rate})
+    return best[1] if best else None
+
+
+def detect_cameras(max_index=10, cache_file=CACHE_FILE):
+    cameras = sorted(probe_all(max_index, cache_file))
     if not cameras:
         raise RuntimeError("No usable cameras found")
-
     return cameras
 
+
 def create_pipe(pipe_path):
     if not os.path.exists(pipe_path):
         os.mkfifo(pipe_path)
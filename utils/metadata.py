@@ -0,0 +1,86 @@
+"""
+metadata.py  –  utils/metadata.py
+
+Per-frame annotations (motion state, motion box, capture time) published as
+structured data instead of being drawn into the pixels.
+
+Producers call `hub.publish()` once per frame; the web server streams the
+latest state of every camera to browsers over Server-Sent Events and the
+page draws the box and status text itself.  Keeping annotations out of the
+frame means recordings and snapshots stay clean and one JPEG encode can
+serve every consumer.
+
+Like FrameBuffer, only the latest value per camera is kept – a slow client
+skips intermediate updates rather than queueing them.
+"""
+
+import threading
+import time
+from typing import Optional
+
+
+class MetadataHub:
+    def __init__(self):
+        self._latest: dict[int, dict] = {}
+        self._versions: dict[int, int] = {}
+        self._version: int = 0
+        self._lock = threading.Condition()
+
+    def publish(self, cam_index: int, motion: bool, box: Optional[list] = None,
+                timestamp: Optional[float] = None, objects: Optional[list] = None) -> None:
+        """
+        Record the state of one frame.  `box` is [x1, y1, x2, y2] normalised
+        to 0..1 of the frame size, or None.  `objects` are classifier
+        detections ({"label", "score", "box"}), or None when no classifier
+        runs.  Subscribers are only woken when the motion state, box or
+        objects change, or the capture second ticks over.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            prev = self._latest.get(cam_index)
+            changed = (
+                prev is None
+                or prev["motion"] != motion
+                or prev["box"] != box
+                or prev.get("objects") != objects
+                or int(prev["ts"]) != int(timestamp)
+            )
+            self._latest[cam_index] = {
+                "cam": cam_index,
+                "ts": round(timestamp, 3),
+                "motion": motion,
+                "box": box,
+            }
+            if objects is not None:
+                self._latest[cam_index]["objects"] = objects
+            if changed:
+                self._version += 1
+                self._versions[cam_index] = self._version
+                self._lock.notify_all()
+
+    def subscribe(self, timeout: float = 15.0):
+        """
+        Generator that yields a list of updated camera states each time any
+        camera changes.  Yields an empty list on timeout so the caller can
+        send a keepalive.
+        """
+        last_seen = -1
+        while True:
+            with self._lock:
+                if self._version == last_seen:
+                    self._lock.wait(timeout=timeout)
+                updates = [
+                    dict(self._latest[cam])
+                    for cam, version in self._versions.items()
+                    if version > last_seen
+                ]
+                last_seen = self._version
+            yield updates
+
+    def latest(self, cam_index: int) -> Optional[dict]:
+        with self._lock:
+            state = self._latest.get(cam_index)
+            return dict(state) if state else None
+
+
+hub = MetadataHub()
@@ -0,0 +1,173 @@
+"""
+mjpeg_container.py  –  utils/mjpeg_container.py
+
+Append-only recording container for already-encoded JPEG frames.
+
+The live path has already paid for a JPEG encode, so with `record.format:
+mjpeg` CameraRecorder stores those bytes as-is instead of re-encoding every
+frame through the mp4v VideoWriter.  Recording then costs only disk I/O.
+
+Each clip is two files:
+
+    cam{n}_YYYYMMDD_HHMMSS.mjpg       concatenated JPEGs (a raw MJPEG stream)
+    cam{n}_YYYYMMDD_HHMMSS.mjpg.idx   one fixed-size record per frame:
+                                      <float64 wall time, uint64 offset, uint32 length>
+
+Both are only ever appended to, so a clip is readable while it is still being
+written.  `transcode()` turns a closed clip into an MP4 at its real frame rate.
+"""
+
+import os
+import bisect
+import struct
+import time
+import logging
+from typing import Iterator, Optional
+
+import cv2
+import numpy as np
+
+from utils.housekeeping import replace_keeping_mtime
+
+log = logging.getLogger(__name__)
+
+EXT = ".mjpg"
+INDEX_EXT = ".idx"
+_ENTRY = struct.Struct("<dQI")
+_FLUSH_INTERVAL = 1.0       # seconds between flushes while recording
+
+
+def index_path(path: str) -> str:
+    return path + INDEX_EXT
+
+
+class MjpegWriter:
+    """
+    Mirrors the parts of cv2.VideoWriter that CameraRecorder uses, but takes
+    JPEG bytes plus a capture timestamp instead of a BGR frame.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            self._data = open(path, "ab")
+            self._index = open(index_path(path), "ab")
+        except OSError as exc:
+            log.error(f"[MjpegWriter] Cannot open {path}: {exc}")
+            self._data = self._index = None
+            return
+        self._offset = self._data.tell()
+        self._last_flush = time.monotonic()
+
+    def isOpened(self) -> bool:
+        return self._data is not None
+
+    def write(self, jpeg_bytes: bytes, timestamp: float) -> None:
+        self._data.write(jpeg_bytes)
+        self._index.write(_ENTRY.pack(timestamp, self._offset, len(jpeg_bytes)))
+        self._offset += len(jpeg_bytes)
+
+        # Flush periodically so the in-progress clip is reviewable
+        now = time.monotonic()
+        if now - self._last_flush >= _FLUSH_INTERVAL:
+            self._data.flush()
+            self._index.flush()
+            self._last_flush = now
+
+    def release(self) -> None:
+        if self._data is not None:
+            self._data.close()
+            self._index.close()
+            self._data = self._index = None
+
+
+class MjpegReader:
+    """Random access to a (possibly still growing) .mjpg clip."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.timestamps: list[float] = []
+        self._entries: list[tuple[int, int]] = []
+
+        data_size = os.path.getsize(path)
+        with open(index_path(path), "rb") as fh:
+            raw = fh.read()
+        usable = len(raw) - len(raw) % _ENTRY.size
+        for ts, offset, length in _ENTRY.iter_unpack(raw[:usable]):
+            if offset + length > data_size:
+                break               # index flushed ahead of data
+            self.timestamps.append(ts)
+            self._entries.append((offset, length))
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def offsets(self) -> list[int]:
+        """Byte offset of each frame in the data file."""
+        return [offset for offset, _ in self._entries]
+
+    @property
+    def start(self) -> Optional[float]:
+        return self.timestamps[0] if self.timestamps else None
+
+    @property
+    def end(self) -> Optional[float]:
+        return self.timestamps[-1] if self.timestamps else None
+
+    def frames(self, start: float = 0.0, end: float = float("inf")) -> Iterator[tuple[float, bytes]]:
+        """Yield (timestamp, jpeg_bytes) for frames in [start, end), reading only those bytes."""
+        i = bisect.bisect_left(self.timestamps, start)
+        with open(self.path, "rb") as fh:
+            while i < len(self.timestamps) and self.timestamps[i] < end:
+                offset, length = self._entries[i]
+                fh.seek(offset)
+                yield self.timestamps[i], fh.read(length)
+                i += 1
+
+
+def transcode(path: str) -> Optional[str]:
+    """
+    Re-encode a closed .mjpg clip to .mp4 alongside it, at the clip's real
+    average frame rate.  Removes the .mjpg and its index on success and
+    returns the new path.
+    """
+    reader = MjpegReader(path)
+    if len(reader) < 2:
+        return None
+
+    fps = (len(reader) - 1) / max(reader.end - reader.start, 1e-6)
+    directory, name = os.path.split(path)
+    # Hidden until complete, so Footage never lists a half-written clip
+    out_path = os.path.join(directory, ".transcode_" + name[: -len(EXT)] + ".mp4")
+    writer = None
+    try:
+        for _, jpeg_bytes in reader.frames():
+            frame = cv2.imdecode(np.frombuffer(jpeg_bytes, np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                continue
+            if writer is None:
+                h, w = frame.shape[:2]
+                writer = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
+            writer.write(frame)
+    finally:
+        if writer is not None:
+            writer.release()
+
+    if writer is None or not os.path.exists(out_path):
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        return None
+
+    final_path = replace_keeping_mtime(out_path, path, path[: -len(EXT)] + ".mp4")
+    remove(path)
+    return final_path
+
+
+def remove(path: str) -> None:
+    """Delete a clip and its index."""
+    os.remove(path)
+    try:
+        os.remove(index_path(path))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,251 @@
+"""
+mosaic.py  –  utils/mosaic.py
+
+Server-side composited grid of every camera.
+
+A MosaicCompositor pulls the latest JPEG from each camera's FrameBuffer,
+scales it into one tile of a shared canvas, encodes the canvas once per tick
+and pushes the result into its own FrameBuffer.  Every mosaic viewer then
+subscribes to that single buffer, so a wall display showing twelve cameras
+costs one connection and one JPEG decode instead of twelve.
+
+Compositors are created lazily per (layout, width) and shut themselves down
+once nobody has watched them for `IDLE_TIMEOUT` seconds.
+"""
+
+import math
+import threading
+import time
+import logging
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from utils import frame_buffer as fb
+from utils.frame_buffer import FrameBuffer
+
+log = logging.getLogger(__name__)
+
+IDLE_TIMEOUT = 10.0          # seconds without viewers before a compositor exits
+MAX_COMPOSITORS = 4          # distinct (layout, width) combinations kept alive
+MIN_WIDTH, MAX_WIDTH = 320, 3840
+DEFAULT_WIDTH = 1280
+
+_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+}
+
+
+def parse_layout(layout: Optional[str], count: int) -> tuple[int, int]:
+    """
+    Turn "4x3" into (cols, rows).  Falls back to the smallest near-square grid
+    that fits `count` cameras when `layout` is missing or malformed.
+    """
+    if layout:
+        try:
+            cols, rows = (int(v) for v in layout.lower().split("x", 1))
+            if 0 < cols <= 8 and 0 < rows <= 8:
+                return cols, rows
+        except ValueError:
+            pass
+
+    count = max(count, 1)
+    cols = math.ceil(math.sqrt(count))
+    rows = math.ceil(count / cols)
+    return cols, rows
+
+
+class MosaicCompositor:
+    """
+    Composites the latest frame from every registered camera into one JPEG.
+
+    Tiles are only re-decoded when their camera has pushed a new frame, and
+    the canvas is only re-encoded when at least one tile changed.  Tiles
+    take the shape of `source_size`; a camera with a different aspect ratio
+    is letterboxed inside its tile rather than stretched.
+    """
+
+    def __init__(self, cols: int, rows: int, width: int,
+                 source_size: tuple[int, int], fps: float = 10, quality: int = 70):
+        self.cols = cols
+        self.rows = rows
+        source_w, source_h = source_size
+        self.tile_w = width // cols
+        self.tile_h = max(self.tile_w * source_h // source_w, 2)
+        self.interval = 1.0 / max(fps, 1)
+
+        self.frame_buffer = FrameBuffer(-1)
+        self._canvas = np.zeros((self.tile_h * rows, self.tile_w * cols, 3), np.uint8)
+        self._seen: dict[int, int] = {}          # cam_index -> last composited frame_number
+        self._sizes: dict[int, tuple[int, int]] = {}  # cam_index -> full source (w, h)
+        self._placed: dict[int, tuple] = {}      # cam_index -> (slot, x, y, w, h) in the tile
+        self._retained: dict[int, FrameBuffer] = {}   # sources counted as subscribed
+        self._encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+
+        self._last_request = time.monotonic()
+        self._stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True,
+                                       name=f"mosaic-{cols}x{rows}-{width}")
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.frame_buffer.close()
+
+    def touch(self) -> None:
+        """Mark the compositor as wanted so the idle reaper leaves it alone."""
+        self._last_request = time.monotonic()
+
+    @property
+    def idle(self) -> bool:
+        return (self.frame_buffer.subscribers == 0
+                and time.monotonic() - self._last_request > IDLE_TIMEOUT)
+
+    def _fit(self, size: tuple[int, int]) -> tuple[int, int, int, int]:
+        """(x, y, w, h) of a source of `size` letterboxed into one tile."""
+        src_w, src_h = size
+        scale = min(self.tile_w / src_w, self.tile_h / src_h)
+        w = min(max(int(round(src_w * scale)), 1), self.tile_w)
+        h = min(max(int(round(src_h * scale)), 1), self.tile_h)
+        return (self.tile_w - w) // 2, (self.tile_h - h) // 2, w, h
+
+    def _decode_reduction(self, cam_index: int) -> int:
+        # Let libjpeg do the downscale during decode when the tile is much
+        # smaller than this camera's frames - far cheaper than a full decode
+        # + resize.  The first frame of each camera is decoded in full to
+        # learn its size.
+        size = self._sizes.get(cam_index)
+        if size is None:
+            return 1
+        _, _, w, h = self._fit(size)
+        for factor in (4, 2):
+            if w * factor <= size[0] and h * factor <= size[1]:
+                return factor
+        return 1
+
+    def _composite(self) -> bool:
+        """Refresh changed tiles in place.  Returns True if anything changed."""
+        changed = False
+        buffers = sorted(fb.all_buffers().items())[: self.cols * self.rows]
+
+        for slot, (cam_index, buf) in enumerate(buffers):
+            # Reading `latest` doesn't subscribe; register interest so
+            # on-demand relays start pulling for this tile
+            previous = self._retained.get(cam_index)
+            if previous is not buf:
+                if previous is not None:
+                    previous.release()
+                buf.retain()
+                self._retained[cam_index] = buf
+
+            number = buf.frame_number
+            jpeg_bytes = buf.latest
+            if jpeg_bytes is None or self._seen.get(cam_index) == number:
+                continue
+
+            factor = self._decode_reduction(cam_index)
+            img = cv2.imdecode(np.frombuffer(jpeg_bytes, np.uint8), _DECODE_FLAGS[factor])
+            if img is None:
+                continue
+            self._sizes[cam_index] = (img.shape[1] * factor, img.shape[0] * factor)
+
+            row, col = divmod(slot, self.cols)
+            y, x = row * self.tile_h, col * self.tile_w
+            tile = self._canvas[y:y + self.tile_h, x:x + self.tile_w]
+            fit_x, fit_y, fit_w, fit_h = placed = self._fit(self._sizes[cam_index])
+            if self._placed.get(cam_index) != (slot,) + placed:
+                tile[:] = 0                      # clear the bars around a new shape
+                self._placed[cam_index] = (slot,) + placed
+            cv2.resize(img, (fit_w, fit_h), dst=tile[fit_y:fit_y + fit_h, fit_x:fit_x + fit_w],
+                       interpolation=cv2.INTER_AREA)
+
+            self._seen[cam_index] = number
+            changed = True
+
+        return changed
+
+    def _run(self) -> None:
+        try:
+            self._loop()
+        finally:
+            for buf in self._retained.values():
+                buf.release()
+            self._retained.clear()
+
+    def _loop(self) -> None:
+        next_tick = time.monotonic()
+        while not self._stop_event.is_set():
+            if self._composite():
+                ok, jpeg = cv2.imencode(".jpg", self._canvas, self._encode_params)
+                if ok:
+                    self.frame_buffer.push(jpeg.tobytes())
+
+            if self.idle and _reap(self):
+                return
+
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay <= 0:
+                next_tick = time.monotonic()     # fell behind; don't try to catch up
+                continue
+            self._stop_event.wait(timeout=delay)
+
+
+# ------------------------------------------------------------------
+# Registry – one compositor per (cols, rows, width)
+# ------------------------------------------------------------------
+
+_compositors: dict[tuple[int, int, int], MosaicCompositor] = {}
+_compositors_lock = threading.Lock()
+
+
+def get_or_create(layout: Optional[str], width: Optional[int], config) -> Optional[MosaicCompositor]:
+    """
+    Return a running compositor for the requested layout, starting one if
+    necessary.  Returns None when MAX_COMPOSITORS are already running.
+    """
+    cols, rows = parse_layout(layout, len(fb.all_buffers()))
+    width = min(max(int(width or DEFAULT_WIDTH), MIN_WIDTH), MAX_WIDTH)
+    width -= width % (cols * 2)                  # keep tiles an even number of pixels
+    key = (cols, rows, width)
+
+    with _compositors_lock:
+        comp = _compositors.get(key)
+        if comp is None:
+            if len(_compositors) >= MAX_COMPOSITORS:
+                return None
+            # Tiles take the most common camera shape; the rest are letterboxed
+            profiles = [config.profile(i) for i in config.cameras] or [config]
+            sizes = [(p.camera_width, p.camera_height) for p in profiles]
+            comp = MosaicCompositor(cols, rows, width, max(set(sizes), key=sizes.count),
+                                    fps=min(config.camera_fps, 15))
+            _compositors[key] = comp
+            comp.start()
+            log.info(f"Mosaic compositor started: {cols}x{rows} @ {width}px")
+        comp.touch()
+        return comp
+
+
+def _reap(comp: MosaicCompositor) -> bool:
+    with _compositors_lock:
+        # A viewer may have arrived between the idle check and taking the lock
+        if not comp.idle:
+            return False
+        for key, value in list(_compositors.items()):
+            if value is comp:
+                del _compositors[key]
+        comp.stop()
+        log.info(f"Mosaic compositor stopped: {comp.thread.name}")
+        return True
+
+
+def stop_all() -> None:
+    with _compositors_lock:
+        for comp in _compositors.values():
+            comp.stop()
+        _compositors.clear()
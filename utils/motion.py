@@ -8,20 +8,51 @@ class MotionDetector:
         self.contour_area = contour_area
         self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
         self.alpha = 0.1  # Lower = slower background adaptation
-        
-    def preprocess_frame(self, frame):
-        # Resize if needed for faster processing
+        self.motion_box = None  # [x1, y1, x2, y2] normalised to 0..1, or None
+
+        # Working buffers, allocated once per input size and reused every
+        # frame so the steady-state loop doesn't churn full-size arrays
+        self._shape = None
+        self._small = None
+        self._gray_raw = None
+        self._gray = None
+        self._delta = None
+        self._thresh = None
+        self._closed = None
+
+    def _ensure_buffers(self, frame):
+        if frame.shape == self._shape:
+            return
+        self._shape = frame.shape
         height, width = frame.shape[:2]
         if width > 320:
-            new_width = 320
-            new_height = int(height * (320 / width))
-            frame = cv2.resize(frame, (new_width, new_height))
+            small_h = int(height * (320 / width))
+            self._small = np.empty((small_h, 320, 3), np.uint8)
+            gray_shape = (small_h, 320)
+        else:
+            self._small = None
+            gray_shape = (height, width)
+
+        self._gray_raw = np.empty(gray_shape, np.uint8)
+        self._gray = np.empty(gray_shape, np.uint8)
+        self._delta = np.empty(gray_shape, np.uint8)
+        self._thresh = np.empty(gray_shape, np.uint8)
+        self._closed = np.empty(gray_shape, np.uint8)
+        self.prev_gray = None       # background model no longer matches
+
+    def preprocess_frame(self, frame):
+        self._ensure_buffers(frame)
+
+        # Resize if needed for faster processing
+        if self._small is not None:
+            h, w = self._small.shape[:2]
+            frame = cv2.resize(frame, (w, h), dst=self._small)
         
         # Convert grayscale
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=self._gray_raw)
         
         # Use smaller blur kernel
-        return cv2.GaussianBlur(gray, (11, 11), 0)
+        return cv2.GaussianBlur(self._gray_raw, (11, 11), 0, dst=self._gray)
 
     def detect(self, frame):
         gray = self.preprocess_frame(frame)
@@ -29,12 +60,13 @@ class MotionDetector:
         if self.prev_gray is None:
             self.prev_gray = gray.copy()
             self.prev_gray_float = gray.astype(np.float32)
+            self.motion_box = None
             return False, frame
-        delta = cv2.absdiff(self.prev_gray, gray)
-        _, thresh = cv2.threshold(delta, 30, 255, cv2.THRESH_BINARY)
+        delta = cv2.absdiff(self.prev_gray, gray, dst=self._delta)
+        cv2.threshold(delta, 30, 255, cv2.THRESH_BINARY, dst=self._thresh)
    
-        thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, self.kernel)
-        thresh = cv2.dilate(thresh, None, iterations=1)
+        cv2.morphologyEx(self._thresh, cv2.MORPH_CLOSE, self.kernel, dst=self._closed)
+        thresh = cv2.dilate(self._closed, None, dst=self._thresh, iterations=1)
         
         contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         
@@ -55,22 +87,21 @@ class MotionDetector:
                     motion_box[2] = max(motion_box[2], x + w)
                     motion_box[3] = max(motion_box[3], y + h)
         
-        # Draw bounding box if motion detected
+        # Publish the box instead of drawing it - the frame stays clean and
+        # the browser (or add_motion_box when burning in) renders it
         if motion_box:
-            scale_x = frame.shape[1] / gray.shape[1]
-            scale_y = frame.shape[0] / gray.shape[0]
-            
-            x1 = int(motion_box[0] * scale_x)
-            y1 = int(motion_box[1] * scale_y)
-            x2 = int(motion_box[2] * scale_x)
-            y2 = int(motion_box[3] * scale_y)
-            
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
-        
-        # Update background with accumulateWeighted (fix the error)
-        gray_float = gray.astype(np.float32)
-        cv2.accumulateWeighted(gray_float, self.prev_gray_float, self.alpha)
+            h, w = gray.shape[:2]
+            self.motion_box = [
+                round(motion_box[0] / w, 4), round(motion_box[1] / h, 4),
+                round(motion_box[2] / w, 4), round(motion_box[3] / h, 4),
+            ]
+        else:
+            self.motion_box = None
         
-        self.prev_gray = np.uint8(self.prev_gray_float)
+        # Update background in place; accumulateWeighted takes uint8 input
+        # directly, and convertScaleAbs writes the 8-bit copy back into
+        # the existing prev_gray
+        cv2.accumulateWeighted(gray, self.prev_gray_float, self.alpha)
+        cv2.convertScaleAbs(self.prev_gray_float, dst=self.prev_gray)
         
         return motion_detected, frame
\ No newline at end of file
@@ -62,4 +62,14 @@ def add_overlay(frame, cam_index, motion_detected=False):
         h, w = cache['overlay_region'].shape[:2]
         frame[0:h, 0:w] = cache['overlay_region']
     
-    return frame
\ No newline at end of file
+    return frame
+
+def add_motion_box(frame, box):
+    """Burn a normalised [x1, y1, x2, y2] motion box into the frame."""
+    if box:
+        h, w = frame.shape[:2]
+        cv2.rectangle(frame,
+                      (int(box[0] * w), int(box[1] * h)),
+                      (int(box[2] * w), int(box[3] * h)),
+                      (0, 0, 255), 2)
+    return frame
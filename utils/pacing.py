@@ -0,0 +1,115 @@
+"""
+pacing.py  –  utils/pacing.py
+
+Frame pacing driven by capture timestamps instead of sleeps.
+
+The producer reads every frame the sensor delivers (cap.grab() is cheap – the
+MJPEG decode only happens in retrieve()) and asks FramePacer whether to keep
+it.  Frames are kept on a fixed schedule of due times derived from the
+capture timestamps, so a 30 fps sensor decimated to 10 fps keeps exactly
+every third frame with no drift and no time lost sleeping.
+
+FramePacer also measures what the sensor and the pipeline actually deliver,
+which the producer exposes via /status and the recorder uses as the clip
+frame rate so recordings play back at real speed.
+"""
+
+import math
+import time
+from typing import Optional
+
+# The V4L2 backend reports buffer timestamps on CLOCK_MONOTONIC; anything
+# further than this from time.monotonic() is treated as unusable.
+_MAX_CLOCK_SKEW = 1.0
+_EMA_ALPHA = 0.05
+
+
+def capture_timestamp(cap_pos_msec: float) -> float:
+    """
+    Monotonic capture time of the frame just grabbed.  Uses the driver's
+    buffer timestamp when it looks sane, otherwise the time of the call.
+    """
+    now = time.monotonic()
+    ts = cap_pos_msec / 1000.0
+    if ts > 0 and abs(now - ts) < _MAX_CLOCK_SKEW:
+        return ts
+    return now
+
+
+def to_wall_clock(monotonic_ts: float) -> float:
+    return time.time() - (time.monotonic() - monotonic_ts)
+
+
+class FramePacer:
+    def __init__(self, target_fps: float):
+        self.interval = 1.0 / target_fps
+        self._next_due: Optional[float] = None
+        self._last_ts: Optional[float] = None
+        self._last_kept: Optional[float] = None
+
+        # Running statistics (exponential moving averages)
+        self._sensor_interval: Optional[float] = None
+        self._kept_interval: Optional[float] = None
+        self._jitter_var: float = 0.0
+        self.frames_seen = 0
+        self.frames_kept = 0
+
+    def should_keep(self, ts: float) -> bool:
+        """Feed every grabbed frame's timestamp; True if this one should be used."""
+        self.frames_seen += 1
+        if self._last_ts is not None and ts > self._last_ts:
+            self._sensor_interval = self._ema(self._sensor_interval, ts - self._last_ts)
+        self._last_ts = ts
+
+        if self._next_due is None:
+            self._next_due = ts
+
+        # Accept a frame up to half a sensor period early so sensor jitter
+        # doesn't push every kept frame one period late.
+        slack = (self._sensor_interval or 0.0) / 2
+        if ts + slack < self._next_due:
+            return False
+
+        self._next_due += self.interval
+        if self._next_due <= ts:
+            # Source stalled or is slower than target - resync, don't burst
+            self._next_due = ts + self.interval
+
+        if self._last_kept is not None:
+            gap = ts - self._last_kept
+            self._kept_interval = self._ema(self._kept_interval, gap)
+            deviation = gap - self.interval
+            self._jitter_var = (1 - _EMA_ALPHA) * self._jitter_var + _EMA_ALPHA * deviation * deviation
+        self._last_kept = ts
+        self.frames_kept += 1
+        return True
+
+    def reset(self) -> None:
+        """Forget timing state (e.g. after the source was reopened)."""
+        self._next_due = self._last_ts = self._last_kept = None
+
+    @staticmethod
+    def _ema(prev: Optional[float], value: float) -> float:
+        return value if prev is None else (1 - _EMA_ALPHA) * prev + _EMA_ALPHA * value
+
+    @property
+    def sensor_fps(self) -> Optional[float]:
+        return 1.0 / self._sensor_interval if self._sensor_interval else None
+
+    @property
+    def delivered_fps(self) -> Optional[float]:
+        return 1.0 / self._kept_interval if self._kept_interval else None
+
+    @property
+    def jitter_ms(self) -> float:
+        """RMS deviation of kept-frame spacing from the target interval."""
+        return math.sqrt(self._jitter_var) * 1000
+
+    def stats(self) -> dict:
+        return {
+            "sensor_fps":    round(self.sensor_fps, 2) if self.sensor_fps else None,
+            "delivered_fps": round(self.delivered_fps, 2) if self.delivered_fps else None,
+            "jitter_ms":     round(self.jitter_ms, 2),
+            "frames_seen":   self.frames_seen,
+            "frames_kept":   self.frames_kept,
+        }
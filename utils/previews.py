@@ -0,0 +1,277 @@
+"""
+previews.py  –  utils/previews.py
+
+Scrub-preview sidecars, built in the background when a clip closes.
+
+For every clip two small files are written next to it:
+
+    <clip>.sprite.jpg     one 160 px wide thumbnail every `interval` seconds,
+                          tiled COLUMNS across
+    <clip>.preview.json   {"duration", "interval", "tile": [w, h], "columns",
+                           "count", "keyframes": {"t": [...]},
+                           "built"}
+
+The keyframe index lists the times of sync frames – read from the MP4
+sample tables, or from the .idx of an .mjpg clip (where every frame is a
+keyframe) – thinned to at most one entry per second.  The recordings page hovers over the
+sprite and seeks on keyframe times, so scrubbing touches a few kilobytes
+instead of the video.  The web server serves both with long cache lifetimes.
+
+Clips change only when transcoded or tiered; those call `remove()` and
+`submit()` again for the new file.
+"""
+
+import os
+import json
+import time
+import struct
+import logging
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from utils import mjpeg_container
+from utils.housekeeping import BackgroundWorker
+from utils.mjpeg_container import MjpegReader
+
+log = logging.getLogger(__name__)
+
+SPRITE_SUFFIX = ".sprite.jpg"
+INDEX_SUFFIX = ".preview.json"
+TILE_WIDTH = 160
+COLUMNS = 10
+SPRITE_QUALITY = 70
+MIN_KEYFRAME_GAP = 1.0          # keep at most one index entry per this many seconds
+
+
+def sprite_path(clip_path: str) -> str:
+    return clip_path + SPRITE_SUFFIX
+
+
+def index_path(clip_path: str) -> str:
+    return clip_path + INDEX_SUFFIX
+
+
+def remove(clip_path: str) -> None:
+    """Delete a clip's sidecars, if it has any."""
+    for path in (sprite_path(clip_path), index_path(clip_path)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# ----------------------------------------------------------------------
+# Keyframe index
+# ----------------------------------------------------------------------
+
+def _boxes(data: bytes, start: int = 0, end: Optional[int] = None):
+    """Yield (type, payload_start, payload_end) for the MP4 boxes in data[start:end]."""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield kind, pos + header, min(pos + size, end)
+        pos += size
+
+
+def _child(data: bytes, start: int, end: int, kind: bytes) -> Optional[tuple[int, int]]:
+    for box, s, e in _boxes(data, start, end):
+        if box == kind:
+            return s, e
+    return None
+
+
+def _read_moov(path: str) -> Optional[bytes]:
+    with open(path, "rb") as fh:
+        size = os.fstat(fh.fileno()).st_size
+        pos = 0
+        while pos + 8 <= size:
+            fh.seek(pos)
+            head = fh.read(16)
+            box_size, kind = struct.unpack_from(">I4s", head)
+            header = 8
+            if box_size == 1:
+                box_size = struct.unpack_from(">Q", head, 8)[0]
+                header = 16
+            elif box_size == 0:
+                box_size = size - pos
+            if box_size < header:
+                return None
+            if kind == b"moov":
+                fh.seek(pos + header)
+                return fh.read(box_size - header)
+            pos += box_size
+    return None
+
+
+def _mp4_keyframes(path: str) -> list[float]:
+    moov = _read_moov(path)
+    if moov is None:
+        return []
+
+    for kind, start, end in _boxes(moov):
+        if kind != b"trak":
+            continue
+        mdia = _child(moov, start, end, b"mdia")
+        if mdia is None:
+            continue
+        hdlr = _child(moov, *mdia, b"hdlr")
+        if hdlr is None or moov[hdlr[0] + 8:hdlr[0] + 12] != b"vide":
+            continue
+
+        mdhd = _child(moov, *mdia, b"mdhd")
+        version = moov[mdhd[0]]
+        timescale = struct.unpack_from(">I", moov, mdhd[0] + (20 if version == 1 else 12))[0]
+        minf = _child(moov, *mdia, b"minf")
+        stbl = _child(moov, *minf, b"stbl") if minf else None
+        if not stbl or not timescale:
+            return []
+        tables = {kind: (s, e) for kind, s, e in _boxes(moov, *stbl)}
+
+        def entries(kind, fmt):
+            s, _ = tables[kind]
+            count = struct.unpack_from(">I", moov, s + 4)[0]
+            return struct.iter_unpack(fmt, moov[s + 8:s + 8 + count * struct.calcsize(fmt)])
+
+        # Sample start times
+        times = []
+        t = 0
+        for count, delta in entries(b"stts", ">II"):
+            times.extend(range(t, t + count * delta, delta) if delta else [t] * count)
+            t += count * delta
+
+        if b"stss" in tables:
+            sync = [n - 1 for (n,) in entries(b"stss", ">I")]
+        else:
+            sync = range(len(times))
+        return [times[i] / timescale for i in sync if i < len(times)]
+    return []
+
+
+def _mjpeg_keyframes(path: str) -> list[float]:
+    reader = MjpegReader(path)
+    return [ts - reader.start for ts in reader.timestamps]
+
+
+def keyframes(path: str) -> list[float]:
+    """Seconds into the clip of sync frames, at most one per second."""
+    if path.endswith(mjpeg_container.EXT):
+        frames = _mjpeg_keyframes(path)
+    else:
+        frames = _mp4_keyframes(path)
+
+    thinned = []
+    for t in frames:
+        if not thinned or t - thinned[-1] >= MIN_KEYFRAME_GAP:
+            thinned.append(round(t, 2))
+    return thinned
+
+
+# ----------------------------------------------------------------------
+# Sprite sheet
+# ----------------------------------------------------------------------
+
+def _tiles(path: str, interval: float) -> tuple[list, float]:
+    """Frames at 0, interval, 2*interval, ... and the clip duration."""
+    tiles = []
+    if path.endswith(mjpeg_container.EXT):
+        reader = MjpegReader(path)
+        if not len(reader):
+            return [], 0.0
+        duration = reader.end - reader.start
+        t = 0.0
+        while t <= duration:
+            for _, jpeg_bytes in reader.frames(reader.start + t):
+                # Decode at reduced size - only a thumbnail is needed
+                frame = cv2.imdecode(np.frombuffer(jpeg_bytes, np.uint8), cv2.IMREAD_REDUCED_COLOR_2)
+                if frame is not None:
+                    tiles.append(frame)
+                break
+            t += interval
+        return tiles, duration
+
+    cap = cv2.VideoCapture(path)
+    try:
+        frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if not cap.isOpened() or frames <= 0 or fps <= 0:
+            return [], 0.0
+        duration = frames / fps
+        t = 0.0
+        while t < duration:
+            cap.set(cv2.CAP_PROP_POS_MSEC, t * 1000)
+            ret, frame = cap.read()
+            if not ret:
+                break
+            tiles.append(frame)
+            t += interval
+        return tiles, duration
+    finally:
+        cap.release()
+
+
+def build(path: str, interval: float) -> bool:
+    """Write the sprite sheet and index for one closed clip."""
+    tiles, duration = _tiles(path, interval)
+    if not tiles:
+        return False
+
+    h, w = tiles[0].shape[:2]
+    tile_w = TILE_WIDTH
+    tile_h = max(int(round(h * TILE_WIDTH / w)) // 2 * 2, 2)
+    columns = min(COLUMNS, len(tiles))
+    rows = (len(tiles) + columns - 1) // columns
+    sheet = np.zeros((rows * tile_h, columns * tile_w, 3), np.uint8)
+    for i, frame in enumerate(tiles):
+        y, x = (i // columns) * tile_h, (i % columns) * tile_w
+        sheet[y:y + tile_h, x:x + tile_w] = cv2.resize(frame, (tile_w, tile_h),
+                                                       interpolation=cv2.INTER_AREA)
+
+    ok, jpeg = cv2.imencode(".jpg", sheet, [int(cv2.IMWRITE_JPEG_QUALITY), SPRITE_QUALITY])
+    if not ok:
+        return False
+
+    index = {
+        "duration": round(duration, 2),
+        "interval": interval,
+        "tile": [tile_w, tile_h],
+        "columns": columns,
+        "count": len(tiles),
+        "keyframes": {"t": keyframes(path)},
+        "built": int(time.time()),      # cache-busts the (immutable) sprite URL
+    }
+
+    # Sprite first: the index's presence means the preview is complete
+    tmp = sprite_path(path) + ".tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(jpeg.data)
+    os.replace(tmp, sprite_path(path))
+    tmp = index_path(path) + ".tmp"
+    with open(tmp, "w") as fh:
+        json.dump(index, fh, separators=(",", ":"))
+    os.replace(tmp, index_path(path))
+    return True
+
+
+def _build_job(path: str, interval: float) -> None:
+    if os.path.exists(path) and not build(path, interval):
+        log.debug(f"[Previews] Nothing to preview in {os.path.basename(path)}")
+
+
+_builder = BackgroundWorker("preview-builder", _build_job)
+
+
+def submit(path: str, interval: float) -> None:
+    """Queue a closed clip for preview building (no-op if previews are off)."""
+    if interval > 0:
+        _builder.submit(path, interval)
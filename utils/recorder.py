@@ -4,7 +4,7 @@ recorder.py  –  utils/recorder.py
 Two classes:
 
   CameraRecorder    – writes rolling MP4 clips, cleans up old ones.
-  MotionSnapshot    – saves a JPEG still on the rising edge of motion detection.
+  MotionSnapshot    – saves JPEG stills of motion events on a background pool.
 
 Both are driven from CameraProducer.  Usage:
 
@@ -12,8 +12,8 @@ Both are driven from CameraProducer.  Usage:
     snapshotter = MotionSnapshot(cam_index, config)
 
     # in capture loop:
-    recorder.write(raw_frame)
-    snapshotter.on_frame(raw_frame, motion_detected)
+    recorder.write(raw_frame, jpeg_bytes, motion_detected)
+    snapshotter.on_frame(raw_frame, motion_detected, motion_box, timestamp)
 """
 
 import cv2
@@ -22,8 +22,16 @@ import time
 import threading
 import datetime
 import logging
+import queue
 import shutil
 
+import numpy as np
+
+from utils import mjpeg_container, previews
+from utils.housekeeping import BackgroundWorker
+from utils.mjpeg_container import MjpegWriter
+from utils.segments import SegmentIndex, segments_root
+
 log = logging.getLogger(__name__)
 
 
@@ -33,10 +41,21 @@ log = logging.getLogger(__name__)
 
 class MotionSnapshot:
     """
-    Saves a JPEG still photo when motion is first detected (rising edge only –
-    one photo per motion event, not one per frame).
+    Saves JPEG stills of motion events.  `snapshot.mode` picks which frames:
+
+      first  – the frame where motion starts (rising edge only – one photo
+               per motion event, not one per frame).  The default.
+      burst  – `snapshot.burst_count` frames spread evenly over the first
+               `snapshot.burst_window` seconds of the event.
+      peak   – the single frame with the largest motion box within the
+               first `snapshot.burst_window` seconds.
+
+    The capture thread only copies the frame; encoding and disk I/O happen on
+    the shared snapshot writer pool.  If that falls behind, new snapshots are
+    dropped (and counted) rather than stalling capture.
 
     Files are saved to:  <storage_path>/snapshots/cam{n}_YYYYMMDD_HHMMSS.jpg
+    (burst frames get an _1, _2, ... suffix).
     """
 
     def __init__(self, cam_index: int, config):
@@ -45,35 +64,97 @@ class MotionSnapshot:
         self._was_motion = False      # motion state from the previous frame
         self._lock = threading.Lock()
 
-    def on_frame(self, frame, motion_detected: bool) -> None:
+        self.mode = getattr(config, "snapshot_mode", "first")
+        self.burst_count = max(int(getattr(config, "snapshot_burst_count", 3)), 1)
+        self.burst_window = float(getattr(config, "snapshot_burst_window", 2.0))
+        self.quality = int(getattr(config, "snapshot_quality", 90))
+
+        # Current event
+        self._event_start = 0.0
+        self._event_name = ""
+        self._taken = 0
+        self._peak_frame = None
+        self._peak_area = -1.0
+        self._peak_pending = False
+        self._event_dropped = False    # warn once per event, not per frame
+
+        self.queued = 0
+        self.dropped = 0
+
+    def on_frame(self, frame, motion_detected: bool, motion_box=None, timestamp=None) -> None:
         """
-        Call with every raw BGR frame and the current motion flag.
-        A JPEG is written only on the rising edge (False -> True transition).
+        Call with every raw BGR frame, the current motion flag and, for
+        `peak` mode, the normalised motion box from MotionDetector.
         """
         if not self.config.motion_detection:
             return
 
+        now = time.time() if timestamp is None else timestamp
         with self._lock:
             rising_edge = motion_detected and not self._was_motion
             self._was_motion = motion_detected
 
-        if not rising_edge:
+        if rising_edge:
+            self._event_start = now
+            self._event_name = datetime.datetime.fromtimestamp(now).strftime("%Y%m%d_%H%M%S")
+            self._taken = 0
+            self._peak_area = -1.0
+            self._peak_pending = self.mode == "peak"
+            self._event_dropped = False
+
+        if self.mode == "burst":
+            self._burst(frame, now)
+        elif self.mode == "peak":
+            self._peak(frame, motion_detected, motion_box, now)
+        elif rising_edge:
+            self._submit(frame, f"cam{self.cam_index}_{self._event_name}.jpg")
+
+    def _burst(self, frame, now: float) -> None:
+        if not self._event_name or self._taken >= self.burst_count:
             return
+        due = self._event_start + self._taken * self.burst_window / self.burst_count
+        if now >= due:
+            self._taken += 1
+            self._submit(frame, f"cam{self.cam_index}_{self._event_name}_{self._taken}.jpg")
 
+    def _peak(self, frame, motion_detected: bool, motion_box, now: float) -> None:
+        if not self._peak_pending:
+            return
+        in_window = now - self._event_start < self.burst_window
+        if motion_detected and in_window:
+            area = 0.0
+            if motion_box:
+                area = (motion_box[2] - motion_box[0]) * (motion_box[3] - motion_box[1])
+            if area > self._peak_area:
+                # Keep our own copy; the producer reuses its frame buffer
+                if self._peak_frame is None or self._peak_frame.shape != frame.shape:
+                    self._peak_frame = np.empty_like(frame)
+                np.copyto(self._peak_frame, frame)
+                self._peak_area = area
+            return
+
+        # Window over or motion ended - save the best frame seen
+        self._peak_pending = False
+        if self._peak_area >= 0:
+            self._submit(self._peak_frame, f"cam{self.cam_index}_{self._event_name}.jpg")
+
+    def _submit(self, frame, filename: str) -> None:
         snap_dir = os.path.join(self.config.storage_path, "snapshots")
-        os.makedirs(snap_dir, exist_ok=True)
+        if _snapshot_writer.submit(os.path.join(snap_dir, filename), frame.copy(), self.quality):
+            self.queued += 1
+            return
+        self.dropped += 1
+        if not self._event_dropped:
+            log.warning(f"[Snapshot cam{self.cam_index}] Writer queue full - dropped {filename} "
+                        f"({self.dropped} dropped so far)")
+        self._event_dropped = True
 
-        ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"cam{self.cam_index}_{ts}.jpg"
-        path = os.path.join(snap_dir, filename)
+    def flush(self, timeout: float = 5.0) -> None:
+        """Wait (bounded) for queued snapshots to reach disk, e.g. on shutdown."""
+        _snapshot_writer.drain(timeout)
 
-        ok, jpeg = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), 90])
-        if ok:
-            with open(path, "wb") as fh:
-                fh.write(jpeg.tobytes())
-            log.info(f"[Snapshot cam{self.cam_index}] Motion detected - saved {filename}")
-        else:
-            log.warning(f"[Snapshot cam{self.cam_index}] Failed to encode JPEG")
+    def stats(self) -> dict:
+        return {"snapshots_queued": self.queued, "snapshots_dropped": self.dropped}
 
 
 # ---------------------------------------------------------------------------
@@ -86,6 +167,18 @@ class CameraRecorder:
 
       - Each clip is `recording_length` minutes long (from config).
       - Files are named  cam{n}_YYYYMMDD_HHMMSS.mp4  under `storage_path`.
+      - With `record.format: mjpeg` the live JPEGs are appended to a .mjpg
+        container instead (see utils/mjpeg_container.py), optionally
+        transcoded to MP4 in the background once each clip closes.
+      - With `record.idle_fps` set, mjpeg clips keep frames at that rate
+        while there is no motion and at full rate during motion plus
+        `record.post_roll` seconds; each frame carries its own timestamp, so
+        fewer frames is all it takes.  mp4 clips need a constant-rate
+        timeline and would have to re-encode a repeated frame for every
+        skipped one, which saves nothing, so they always record at full rate.
+      - With `record.mode: segmented` clips are `segment_length` seconds long,
+        live under  segments/cam{n}/YYYYMMDD/  and are appended to a seek
+        index as they close (see utils/segments.py).
       - A background thread runs every hour and deletes clips older than
         `video_retention` days.  Set video_retention=0 to keep forever.
     """
@@ -96,8 +189,30 @@ class CameraRecorder:
 
         self._writer = None
         self._clip_start = 0.0
+        self._clip_wall_start = 0.0
         self._clip_path = ""
         self._frame_count = 0
+        self._clip_fps = config.camera_fps
+
+        # Delivered frame rate reported by the producer's pacer, if any
+        self.measured_fps = None
+
+        self._segmented = getattr(config, "record_mode", "continuous") == "segmented"
+        self._mjpeg = getattr(config, "record_format", "mp4") == "mjpeg"
+
+        # Adaptive frame rate (motion-keyed)
+        self._idle_interval = 0.0
+        idle_fps = getattr(config, "record_idle_fps", 0)
+        if idle_fps > 0 and config.motion_detection:
+            if self._mjpeg:
+                self._idle_interval = 1.0 / idle_fps
+            else:
+                log.info(f"[Recorder cam{cam_index}] record.idle_fps only applies to "
+                         f"record.format: mjpeg; recording mp4 at full rate")
+        self._last_motion = 0.0
+        self._last_kept = None
+        self._last_jpeg = None        # last JPEG from the producer, reused for suppressed frames
+        self._segments = SegmentIndex(config.storage_path, cam_index) if self._segmented else None
 
         self._lock = threading.Lock()
         self._stop_event = threading.Event()
@@ -108,20 +223,62 @@ class CameraRecorder:
         )
         self._cleanup_thread.start()
 
-    def write(self, frame) -> None:
-        """Accept a raw BGR frame. Opens / rolls clips automatically."""
+    def write(self, frame, jpeg_bytes=None, motion_detected: bool = False,
+              timestamp: float = None) -> None:
+        """
+        Accept a raw BGR frame and, if the caller already has one, its JPEG
+        encoding and wall-clock capture time.  Opens / rolls clips automatically.
+        """
         if not self.config.record:
             return
 
         with self._lock:
-            now = time.time()
-            if self._writer is None or (now - self._clip_start) >= self.config.recording_length * 60:
+            now = time.time() if timestamp is None else timestamp
+            if jpeg_bytes is not None:
+                self._last_jpeg = jpeg_bytes
+            if self._writer is None or (now - self._clip_start) >= self._clip_seconds:
                 self._open_new_clip(frame)
 
+            if self._idle_interval and not self._keep(now, motion_detected):
+                return
+
             if self._writer and self._writer.isOpened():
-                self._writer.write(frame)
+                if self._mjpeg:
+                    if jpeg_bytes is None and self._last_jpeg is not None:
+                        # The producer skipped encoding an unchanged frame
+                        # (static-scene suppression); record the image it
+                        # last sent rather than encoding on the capture thread
+                        jpeg_bytes = self._last_jpeg
+                    elif jpeg_bytes is None:
+                        quality = int(getattr(self.config, "jpeg_quality", 95))
+                        ok, jpeg = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+                        if not ok:
+                            return
+                        jpeg_bytes = jpeg.tobytes()
+                    self._writer.write(jpeg_bytes, now)
+                else:
+                    self._writer.write(frame)
                 self._frame_count += 1
 
+    def _keep(self, now: float, motion_detected: bool) -> bool:
+        """Whether to record this frame under adaptive frame rate (mjpeg only)."""
+        if motion_detected:
+            self._last_motion = now
+        if now - self._last_motion <= self.config.record_post_roll:
+            self._last_kept = None
+            return True
+
+        if self._last_kept is not None and now - self._last_kept < self._idle_interval:
+            return False
+        self._last_kept = now
+        return True
+
+    @property
+    def _clip_seconds(self) -> float:
+        if self._segmented:
+            return self.config.segment_length
+        return self.config.recording_length * 60
+
     def stop(self) -> None:
         """Flush and close the current clip cleanly."""
         self._stop_event.set()
@@ -134,15 +291,27 @@ class CameraRecorder:
         storage = self.config.storage_path
         os.makedirs(storage, exist_ok=True)
 
-        ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"cam{self.cam_index}_{ts}.mp4"
-        self._clip_path = os.path.join(storage, filename)
+        now = datetime.datetime.now()
+        ext = mjpeg_container.EXT if self._mjpeg else ".mp4"
+        if self._segmented:
+            self._clip_path = self._segments.segment_path(now, ext)
+        else:
+            ts = now.strftime("%Y%m%d_%H%M%S")
+            self._clip_path = os.path.join(storage, f"cam{self.cam_index}_{ts}{ext}")
+        filename = os.path.basename(self._clip_path)
 
-        h, w = frame.shape[:2]
-        fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-        self._writer = cv2.VideoWriter(
-            self._clip_path, fourcc, self.config.camera_fps, (w, h)
-        )
+        # Stamp the clip with the rate frames really arrive at, so it plays
+        # back at real speed even if the camera can't reach camera_fps
+        self._clip_fps = round(self.measured_fps, 2) if self.measured_fps else self.config.camera_fps
+
+        if self._mjpeg:
+            self._writer = MjpegWriter(self._clip_path)
+        else:
+            h, w = frame.shape[:2]
+            fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+            self._writer = cv2.VideoWriter(
+                self._clip_path, fourcc, self._clip_fps, (w, h)
+            )
 
         if not self._writer.isOpened():
             log.error(f"[Recorder cam{self.cam_index}] Failed to open {self._clip_path}")
@@ -150,16 +319,37 @@ class CameraRecorder:
             return
 
         self._clip_start = time.time()
+        self._clip_wall_start = now.timestamp()
         self._frame_count = 0
-        log.info(f"[Recorder cam{self.cam_index}] New clip: {filename}")
+        self._last_kept = None        # start every clip with a frame
+        if not self._segmented:
+            log.info(f"[Recorder cam{self.cam_index}] New clip: {filename}")
 
     def _close_clip(self) -> None:
         if self._writer is not None:
             self._writer.release()
-            log.info(
-                f"[Recorder cam{self.cam_index}] Closed {os.path.basename(self._clip_path)} "
-                f"({self._frame_count} frames)"
-            )
+            end = time.time()
+            if self._segmented:
+                # mjpeg clips play back at their real rate, not the nominal fps
+                fps = self._clip_fps
+                if self._mjpeg:
+                    fps = self._frame_count / max(end - self._clip_wall_start, 1e-6)
+                # Segments roll every few seconds - index instead of logging
+                self._segments.append(
+                    self._clip_path, self._clip_wall_start, end,
+                    self._frame_count, fps,
+                )
+            else:
+                log.info(
+                    f"[Recorder cam{self.cam_index}] Closed {os.path.basename(self._clip_path)} "
+                    f"({self._frame_count} frames)"
+                )
+            # Scrub previews are built for the transcoded MP4 when there is one
+            preview_interval = float(getattr(self.config, "record_preview_interval", 10))
+            if self._mjpeg and getattr(self.config, "record_transcode", False):
+                _transcoder.submit(self._clip_path, preview_interval)
+            else:
+                previews.submit(self._clip_path, preview_interval)
             self._writer = None
             self._frame_count = 0
 
@@ -169,6 +359,40 @@ class CameraRecorder:
             if self._stop_event.wait(timeout=60):
                 return
 
+    def _segment_dir(self) -> str:
+        return os.path.join(segments_root(self.config.storage_path), f"cam{self.cam_index}")
+
+    def _list_clips(self) -> list[str]:
+        """This camera's recordings: its rolling clips plus its segments."""
+        storage = self.config.storage_path
+        exts = (".mp4", mjpeg_container.EXT)
+        prefix = f"cam{self.cam_index}_"
+        paths = [os.path.join(storage, f) for f in os.listdir(storage)
+                 if f.startswith(prefix) and f.endswith(exts)]
+        for dirpath, _, filenames in os.walk(self._segment_dir()):
+            paths.extend(os.path.join(dirpath, f) for f in filenames if f.endswith(exts))
+        return paths
+
+    @staticmethod
+    def _remove_clip(path: str) -> None:
+        if path.endswith(mjpeg_container.EXT):
+            mjpeg_container.remove(path)
+        else:
+            os.remove(path)
+        previews.remove(path)
+
+    def _prune_segment_dirs(self) -> None:
+        """Remove this camera's day directories whose segments have all been deleted."""
+        for dirpath, dirnames, filenames in os.walk(self._segment_dir(), topdown=False):
+            if dirnames or any(f.endswith((".mp4", mjpeg_container.EXT)) for f in filenames):
+                continue
+            try:
+                for f in filenames:
+                    os.remove(os.path.join(dirpath, f))
+                os.rmdir(dirpath)
+            except OSError:
+                pass
+
     def _delete_old_clips(self) -> None:
         storage = self.config.storage_path
         if not os.path.isdir(storage):
@@ -184,13 +408,11 @@ class CameraRecorder:
             # If free space is less than buffer, delete oldest clips until we have enough
             if free < BUFFER_BYTES:
                 mp4s = []
-                for fname in os.listdir(storage):
-                    if fname.endswith(".mp4"):
-                        fpath = os.path.join(storage, fname)
-                        try:
-                            mp4s.append((os.path.getmtime(fpath), fpath))
-                        except OSError:
-                            pass
+                for fpath in self._list_clips():
+                    try:
+                        mp4s.append((os.path.getmtime(fpath), fpath))
+                    except OSError:
+                        pass
                 
                 mp4s.sort(key=lambda x: x[0])
                 
@@ -199,7 +421,7 @@ class CameraRecorder:
                         break
                     try:
                         size = os.path.getsize(fpath)
-                        os.remove(fpath)
+                        self._remove_clip(fpath)
                         free += size
                         log.info(f"[Recorder] Deleted old clip due to low disk space: {fpath}")
                     except OSError as exc:
@@ -210,20 +432,96 @@ class CameraRecorder:
         # 2. Enforce time-based retention
         retention_days = float(self.config.video_retention)
         if retention_days <= 0:
+            self._prune_segment_dirs()
             return
 
         cutoff = time.time() - retention_days * 86400
         deleted = 0
-        for fname in os.listdir(storage):
-            if not fname.endswith(".mp4"):
-                continue
-            fpath = os.path.join(storage, fname)
+        for fpath in self._list_clips():
             try:
                 if os.path.getmtime(fpath) < cutoff:
-                    os.remove(fpath)
+                    self._remove_clip(fpath)
                     deleted += 1
             except OSError as exc:
                 log.warning(f"[Recorder] Could not delete {fpath}: {exc}")
 
+        self._prune_segment_dirs()
+
         if deleted:
-            log.info(f"[Recorder cam{self.cam_index}] Deleted {deleted} old clip(s) based on retention time.")
\ No newline at end of file
+            log.info(f"[Recorder cam{self.cam_index}] Deleted {deleted} old clip(s) based on retention time.")
+
+# ---------------------------------------------------------------------------
+# Background mjpeg -> MP4 transcoding
+# ---------------------------------------------------------------------------
+
+def _transcode(path: str, preview_interval: float = 0) -> None:
+    """
+    Convert one closed .mjpg clip when `record.transcode` is on, then queue
+    its preview.  Runs on the shared low-priority `_transcoder` worker.
+    """
+    out = None
+    try:
+        out = mjpeg_container.transcode(path)
+        if out:
+            log.info(f"[Recorder] Transcoded {os.path.basename(path)} -> {os.path.basename(out)}")
+    except Exception as exc:
+        log.warning(f"[Recorder] Transcode of {path} failed: {exc}")
+    previews.submit(out or path, preview_interval)
+
+
+_transcoder = BackgroundWorker("recorder-transcode", _transcode)
+
+
+class _SnapshotWriter:
+    """
+    Small pool of threads shared by every MotionSnapshot that encodes and
+    writes stills off the capture path.  The queue is bounded so a slow disk
+    costs dropped snapshots, never capture latency or unbounded memory.
+    """
+
+    QUEUE_SIZE = 32
+    WORKERS = 2
+
+    def __init__(self):
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=self.QUEUE_SIZE)
+        self._threads: list[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def submit(self, path: str, frame, quality: int) -> bool:
+        """Queue a frame (which the writer now owns).  False if the queue is full."""
+        with self._lock:
+            if not self._threads:
+                for i in range(self.WORKERS):
+                    thread = threading.Thread(target=self._run, daemon=True,
+                                              name=f"snapshot-writer-{i}")
+                    thread.start()
+                    self._threads.append(thread)
+        try:
+            self._queue.put_nowait((path, frame, quality))
+        except queue.Full:
+            return False
+        return True
+
+    def drain(self, timeout: float) -> None:
+        with self._queue.all_tasks_done:
+            self._queue.all_tasks_done.wait_for(lambda: not self._queue.unfinished_tasks, timeout)
+
+    def _run(self) -> None:
+        while True:
+            path, frame, quality = self._queue.get()
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                ok, jpeg = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+                if ok:
+                    with open(path, "wb") as fh:
+                        fh.write(jpeg.data)
+                    log.info(f"[Snapshot] Motion detected - saved {os.path.basename(path)}")
+                else:
+                    log.warning(f"[Snapshot] Failed to encode {os.path.basename(path)}")
+            except OSError as exc:
+                log.warning(f"[Snapshot] Could not write {path}: {exc}")
+            finally:
+                self._queue.task_done()
+
+
+_snapshot_writer = _SnapshotWriter()
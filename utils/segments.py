@@ -0,0 +1,147 @@
+"""
+segments.py  –  utils/segments.py
+
+On-disk layout and seek index for segmented recording.
+
+In segmented mode CameraRecorder writes short fixed-length clips instead of
+one long one, so footage is reviewable as soon as its segment closes.  Each
+closed segment is appended to a per-day JSON-lines index:
+
+    <storage_path>/segments/cam{n}/YYYYMMDD/cam{n}_YYYYMMDD_HHMMSS.mp4
+    <storage_path>/segments/cam{n}/YYYYMMDD/index.jsonl
+
+    {"file": "cam0_20261018_143200.mp4", "start": 1792333920.0,
+     "end": 1792333980.1, "frames": 1799, "fps": 30}
+
+`lookup()` maps a wall-clock time to (segment, offset-in-video) so the server
+can answer "play from 14:32:10" by serving a single small file.
+"""
+
+import os
+import json
+import bisect
+import datetime
+import logging
+import threading
+from typing import Optional
+
+log = logging.getLogger(__name__)
+
+INDEX_NAME = "index.jsonl"
+
+
+def segments_root(storage_path: str) -> str:
+    return os.path.join(storage_path, "segments")
+
+
+class SegmentIndex:
+    """Reads and appends the segment index for one camera."""
+
+    def __init__(self, storage_path: str, cam_index: int):
+        self.storage_path = storage_path
+        self.cam_index = cam_index
+        self.cam_dir = os.path.join(segments_root(storage_path), f"cam{cam_index}")
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Paths
+    # ------------------------------------------------------------------
+
+    def day_dir(self, when: datetime.datetime) -> str:
+        return os.path.join(self.cam_dir, when.strftime("%Y%m%d"))
+
+    def segment_path(self, when: datetime.datetime, ext: str = ".mp4") -> str:
+        """Absolute path for a new segment starting at `when` (dir is created)."""
+        day = self.day_dir(when)
+        os.makedirs(day, exist_ok=True)
+        return os.path.join(day, f"cam{self.cam_index}_{when.strftime('%Y%m%d_%H%M%S')}{ext}")
+
+    def media_path(self, abs_path: str) -> str:
+        """Path relative to storage_path, as served under /media/."""
+        return os.path.relpath(abs_path, self.storage_path).replace(os.sep, "/")
+
+    # ------------------------------------------------------------------
+    # Writer side
+    # ------------------------------------------------------------------
+
+    def append(self, path: str, start: float, end: float, frames: int, fps: float) -> None:
+        """Record a closed segment.  Called by CameraRecorder._close_clip()."""
+        entry = {
+            "file": os.path.basename(path),
+            "start": round(start, 3),
+            "end": round(end, 3),
+            "frames": frames,
+            "fps": fps,
+        }
+        index_path = os.path.join(os.path.dirname(path), INDEX_NAME)
+        with self._lock:
+            with open(index_path, "a") as fh:
+                fh.write(json.dumps(entry) + "\n")
+
+    # ------------------------------------------------------------------
+    # Reader side
+    # ------------------------------------------------------------------
+
+    def entries(self, day: datetime.date) -> list[dict]:
+        """All indexed segments for one day whose file still exists, by start time."""
+        day_dir = os.path.join(self.cam_dir, day.strftime("%Y%m%d"))
+        index_path = os.path.join(day_dir, INDEX_NAME)
+        if not os.path.isfile(index_path):
+            return []
+
+        entries = []
+        with open(index_path) as fh:
+            for line in fh:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue            # torn final line after a crash
+                path = os.path.join(day_dir, entry["file"])
+                if not os.path.exists(path) and path.endswith(".mjpg"):
+                    path = path[:-5] + ".mp4"       # transcoded since indexing
+                if os.path.exists(path):
+                    entry["path"] = path
+                    entries.append(entry)
+
+        entries.sort(key=lambda e: e["start"])
+        return entries
+
+    def days(self) -> list[datetime.date]:
+        """Days that have an index, newest first."""
+        if not os.path.isdir(self.cam_dir):
+            return []
+        days = []
+        for name in os.listdir(self.cam_dir):
+            try:
+                days.append(datetime.datetime.strptime(name, "%Y%m%d").date())
+            except ValueError:
+                continue
+        return sorted(days, reverse=True)
+
+    def lookup(self, at: datetime.datetime) -> Optional[tuple[dict, float]]:
+        """
+        Find the segment covering `at` (local time) and the offset into it in
+        video seconds.  If `at` falls in a gap, the next segment that day is
+        returned with offset 0.  Returns None if nothing follows `at`.
+        """
+        # The last segment of the previous day may run past midnight
+        yesterday = at.date() - datetime.timedelta(days=1)
+        entries = self.entries(yesterday)[-1:] + self.entries(at.date())
+        if not entries:
+            return None
+
+        ts = at.timestamp()
+        starts = [e["start"] for e in entries]
+        i = bisect.bisect_right(starts, ts) - 1
+
+        if i >= 0 and ts < entries[i]["end"]:
+            entry = entries[i]
+            # Scale wall-clock offset to video time: the writer stamps frames
+            # at the nominal fps, which may differ from the delivered rate.
+            wall = max(entry["end"] - entry["start"], 1e-6)
+            video = entry["frames"] / entry["fps"] if entry["fps"] else wall
+            return entry, (ts - entry["start"]) * video / wall
+
+        if i + 1 < len(entries):
+            return entries[i + 1], 0.0
+        return None
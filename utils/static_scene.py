@@ -0,0 +1,85 @@
+"""
+static_scene.py  –  utils/static_scene.py
+
+Skips the JPEG encode and FrameBuffer push for frames that look the same as
+the last one sent.  On a quiet camera this stops the producer from encoding
+and waking every viewer with an identical image at full frame rate.
+
+Each frame is reduced to a 32x24 grey thumbnail (an area-averaging resize
+of the full frame, which also smooths out sensor noise) and compared
+with the thumbnail of the last frame sent.  The frame counts as changed if
+more than `threshold` of the thumbnail's pixels moved by more than
+PIXEL_DELTA grey levels.
+
+A frame is always sent at least every `keepalive` seconds so viewers (and
+anything relaying the stream) can tell the camera is alive.  Compare the raw
+frame, before any burned-in overlay: the producer keeps `keepalive` at or
+below one second while burning in so the clock still ticks.
+"""
+
+from typing import Optional
+
+import cv2
+import numpy as np
+
+THUMB_SIZE = (32, 24)
+PIXEL_DELTA = 10
+
+
+class StaticSceneFilter:
+    def __init__(self, threshold: float = 0.005, keepalive: float = 1.0):
+        self.threshold = threshold
+        self.keepalive = keepalive
+        self._min_changed = max(int(threshold * THUMB_SIZE[0] * THUMB_SIZE[1]), 1)
+
+        # Preallocated so the per-frame check allocates nothing
+        self._small = np.empty((THUMB_SIZE[1], THUMB_SIZE[0], 3), np.uint8)
+        self._thumb = np.empty((THUMB_SIZE[1], THUMB_SIZE[0]), np.uint8)
+        self._reference = np.empty_like(self._thumb)
+        self._delta = np.empty_like(self._thumb)
+        self._has_reference = False
+        self._last_sent: Optional[float] = None
+
+        self.frames_checked = 0
+        self.frames_suppressed = 0
+
+    def should_send(self, frame, timestamp: float, force: bool = False) -> bool:
+        """
+        True if `frame` should be encoded and pushed.  `force` (e.g. while
+        motion is detected) always sends.
+        """
+        self.frames_checked += 1
+        cv2.resize(frame, THUMB_SIZE, dst=self._small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._thumb)
+
+        send = (
+            force
+            or not self._has_reference
+            or self._last_sent is None
+            or timestamp - self._last_sent >= self.keepalive
+            or self._changed()
+        )
+        if not send:
+            self.frames_suppressed += 1
+            return False
+
+        np.copyto(self._reference, self._thumb)
+        self._has_reference = True
+        self._last_sent = timestamp
+        return True
+
+    def _changed(self) -> bool:
+        cv2.absdiff(self._thumb, self._reference, dst=self._delta)
+        return cv2.countNonZero(cv2.threshold(self._delta, PIXEL_DELTA, 255,
+                                              cv2.THRESH_BINARY, dst=self._delta)[1]) >= self._min_changed
+
+    def reset(self) -> None:
+        """Forget the reference frame (e.g. after the source was reopened)."""
+        self._has_reference = False
+        self._last_sent = None
+
+    def stats(self) -> dict:
+        return {
+            "frames_checked":    self.frames_checked,
+            "frames_suppressed": self.frames_suppressed,
+        }
@@ -0,0 +1,307 @@
+"""
+tiering.py  –  utils/tiering.py
+
+Background storage tiering: clips older than `record.tier_after` days are
+re-encoded in place at `record.tier_fps` and `record.tier_scale` of their
+resolution, so storage holds months of low-fidelity history instead of weeks
+at full quality.  Retention (`video_retention`) still deletes clips outright
+once they are old enough.
+
+The job runs on one thread at nice 19 and yields to live capture: before
+each clip, and every few frames while encoding, it checks whether any
+producer is falling short of its frame rate or the machine is busy, and if
+so abandons the clip (keeping the original) and waits for the next pass.
+
+Space saved, and which clips have been tiered, is recorded in
+<storage_path>/tiering.json.  A clip is tiered at most once: the ledger,
+not its frame rate, says whether it has been done.
+
+    tiering = StorageTiering(config, producers)
+    tiering.start()
+"""
+
+import os
+import json
+import math
+import time
+import logging
+import threading
+from typing import Iterator, Optional
+
+import cv2
+import numpy as np
+import psutil
+
+from utils import mjpeg_container, previews
+from utils.mjpeg_container import MjpegReader
+from utils.segments import segments_root
+from utils.capture_state import STATE_LIVE
+from utils.housekeeping import lower_priority, replace_keeping_mtime
+
+log = logging.getLogger(__name__)
+
+LEDGER_FILE = "tiering.json"
+PASS_INTERVAL = 600             # seconds between passes
+CHECK_EVERY = 15                # frames between capture-pressure checks
+CPU_SAMPLE_INTERVAL = 1.0       # shortest span a CPU reading may cover (seconds)
+_TMP_PREFIX = ".tier_"          # not picked up by Footage (names must start with "cam")
+
+
+class StorageTiering:
+    def __init__(self, config, producers=None):
+        self.config = config
+        self.producers = producers or []
+        self.tier_after = float(getattr(config, "record_tier_after", 0))
+        self.fps = float(getattr(config, "record_tier_fps", 2))
+        self.scale = float(getattr(config, "record_tier_scale", 0.5))
+        self.max_cpu = float(getattr(config, "record_tier_max_cpu", 75))
+
+        self._ledger_path = os.path.join(config.storage_path, LEDGER_FILE)
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._cpu = 0.0                 # last CPU reading and when it was taken
+        self._cpu_sampled: Optional[float] = None
+
+    def start(self) -> None:
+        if self.tier_after <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True, name="storage-tiering")
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+
+    # ------------------------------------------------------------------
+    # Scheduling
+    # ------------------------------------------------------------------
+
+    def _run(self) -> None:
+        lower_priority()
+        self._cpu_percent()             # prime the sampler
+        while not self._stop_event.wait(timeout=PASS_INTERVAL):
+            try:
+                self.run_pass()
+            except Exception as exc:
+                log.warning(f"[Tiering] Pass failed: {exc}")
+
+    def capture_needs_cpu(self) -> bool:
+        """True if live capture is short of frames or the CPU is saturated."""
+        if self._stop_event.is_set():
+            return True
+        for producer in self.producers:
+            delivered = producer.pacer.delivered_fps
+            if producer.state == STATE_LIVE and delivered and delivered < 0.9 * producer.fps:
+                return True
+        return self._cpu_percent() > self.max_cpu
+
+    def _cpu_percent(self) -> float:
+        """
+        Machine CPU use since the previous reading, re-sampled at most every
+        CPU_SAMPLE_INTERVAL.  Checks come every few frames; a reading over a
+        few milliseconds would be mostly noise.
+        """
+        now = time.monotonic()
+        if self._cpu_sampled is None or now - self._cpu_sampled >= CPU_SAMPLE_INTERVAL:
+            self._cpu = psutil.cpu_percent(None)
+            self._cpu_sampled = now
+        return self._cpu
+
+    def run_pass(self) -> int:
+        """Downsample every eligible clip, oldest first.  Returns clips tiered."""
+        cutoff = time.time() - self.tier_after * 86400
+        clips = self._list_clips()
+        tiered = self._prune(clips)
+        candidates = []
+        for path in clips:
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if mtime < cutoff:
+                candidates.append((mtime, path))
+
+        done = 0
+        for _, path in sorted(candidates):
+            if self.capture_needs_cpu():
+                log.info("[Tiering] Capture needs the CPU - backing off until the next pass")
+                break
+            if self._tier_clip(path, tiered):
+                done += 1
+        return done
+
+    def _list_clips(self) -> list[str]:
+        storage = self.config.storage_path
+        if not os.path.isdir(storage):
+            return []
+        exts = (".mp4", mjpeg_container.EXT)
+        paths = [os.path.join(storage, f) for f in os.listdir(storage)
+                 if f.endswith(exts) and f.startswith("cam")]
+        for dirpath, _, filenames in os.walk(segments_root(storage)):
+            paths.extend(os.path.join(dirpath, f) for f in filenames
+                         if f.endswith(exts) and f.startswith("cam"))
+        return paths
+
+    # ------------------------------------------------------------------
+    # Re-encoding
+    # ------------------------------------------------------------------
+
+    def _already_tiered(self, path: str, tiered: set) -> bool:
+        if self._ledger_key(path) in tiered:
+            return True
+        if path.endswith(mjpeg_container.EXT):
+            return False
+        # Clips tiered before the ledger tracked them
+        cap = cv2.VideoCapture(path)
+        try:
+            if not cap.isOpened():
+                return True             # unreadable - leave it alone
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            return 0 < fps <= self.fps + 0.01
+        finally:
+            cap.release()
+
+    def _frames(self, path: str) -> tuple[Iterator, float]:
+        """(frames at the tier rate, that rate) for an mp4 or .mjpg clip."""
+        if path.endswith(mjpeg_container.EXT):
+            reader = MjpegReader(path)
+
+            def from_mjpeg():
+                # Keep the first frame of each output interval by capture time
+                next_due = reader.start
+                for ts, jpeg_bytes in reader.frames():
+                    if ts < next_due:
+                        continue
+                    frame = cv2.imdecode(np.frombuffer(jpeg_bytes, np.uint8), cv2.IMREAD_COLOR)
+                    if frame is None:
+                        continue
+                    while next_due <= ts:
+                        next_due += 1.0 / self.fps
+                        yield frame
+            return from_mjpeg(), self.fps
+
+        cap = cv2.VideoCapture(path)
+        src_fps = cap.get(cv2.CAP_PROP_FPS) or self.fps
+        # Round the step up so the output never runs faster than tier_fps
+        step = max(math.ceil(src_fps / self.fps - 1e-6), 1)
+
+        def from_video():
+            try:
+                index = 0
+                while cap.grab():
+                    if index % step == 0:
+                        ret, frame = cap.retrieve()
+                        if ret:
+                            yield frame
+                    index += 1
+            finally:
+                cap.release()
+        return from_video(), src_fps / step
+
+    def _tier_clip(self, path: str, tiered: Optional[set] = None) -> bool:
+        if self._already_tiered(path, self._tiered() if tiered is None else tiered):
+            return False
+
+        directory, name = os.path.split(path)
+        out_path = os.path.join(directory, _TMP_PREFIX + os.path.splitext(name)[0] + ".mp4")
+        before = os.path.getsize(path)
+        if path.endswith(mjpeg_container.EXT):
+            before += os.path.getsize(mjpeg_container.index_path(path))
+
+        frames, fps = self._frames(path)
+        writer = None
+        aborted = False
+        try:
+            for count, frame in enumerate(frames):
+                if count % CHECK_EVERY == 0 and count and self.capture_needs_cpu():
+                    aborted = True
+                    break
+                h, w = frame.shape[:2]
+                size = (max(int(w * self.scale) // 2 * 2, 2), max(int(h * self.scale) // 2 * 2, 2))
+                if writer is None:
+                    writer = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+                writer.write(cv2.resize(frame, size, interpolation=cv2.INTER_AREA))
+        finally:
+            frames.close()
+            if writer is not None:
+                writer.release()
+
+        if aborted or writer is None or not os.path.exists(out_path):
+            if os.path.exists(out_path):
+                os.remove(out_path)
+            if aborted:
+                log.info(f"[Tiering] Capture needs the CPU - abandoned {name}")
+            return False
+
+        after = os.path.getsize(out_path)
+        if after >= before:
+            # Nothing to gain (already small); keep the original and don't
+            # try again next pass
+            os.remove(out_path)
+            self._record(path)
+            return False
+
+        final_path = replace_keeping_mtime(out_path, path, os.path.splitext(path)[0] + ".mp4")
+        if path != final_path:
+            mjpeg_container.remove(path)
+
+        # Offsets and tiles of the old file no longer apply
+        previews.remove(path)
+        previews.submit(final_path, float(getattr(self.config, "record_preview_interval", 10)))
+
+        self._record(final_path, before, after)
+        log.info(f"[Tiering] {name}: {before // 1024} KB -> {after // 1024} KB")
+        return True
+
+    # ------------------------------------------------------------------
+    # Ledger
+    # ------------------------------------------------------------------
+
+    def _ledger_key(self, path: str) -> str:
+        return os.path.relpath(path, self.config.storage_path).replace(os.sep, "/")
+
+    def _load(self) -> dict:
+        ledger = {"clips": 0, "bytes_before": 0, "bytes_after": 0, "bytes_saved": 0, "tiered": []}
+        try:
+            with open(self._ledger_path) as fh:
+                ledger.update(json.load(fh))
+        except (OSError, ValueError):
+            pass
+        return ledger
+
+    def _save(self, ledger: dict) -> None:
+        tmp = self._ledger_path + ".tmp"
+        with open(tmp, "w") as fh:
+            json.dump(ledger, fh, indent=2)
+        os.replace(tmp, self._ledger_path)
+
+    def _tiered(self) -> set:
+        return set(self._load()["tiered"])
+
+    def stats(self) -> dict:
+        ledger = self._load()
+        ledger.pop("tiered")
+        return ledger
+
+    def _record(self, path: str, before: int = 0, after: int = 0) -> None:
+        """Mark `path` as tiered (or not worth tiering) and add its savings."""
+        ledger = self._load()
+        if before:
+            ledger["clips"] += 1
+            ledger["bytes_before"] += before
+            ledger["bytes_after"] += after
+            ledger["bytes_saved"] = ledger["bytes_before"] - ledger["bytes_after"]
+        ledger["tiered"] = sorted(set(ledger["tiered"]) | {self._ledger_key(path)})
+        ledger["updated"] = time.time()
+        self._save(ledger)
+
+    def _prune(self, clips: list[str]) -> set:
+        """Drop ledger entries for clips retention has deleted; return the rest."""
+        ledger = self._load()
+        present = {self._ledger_key(path) for path in clips}
+        tiered = [key for key in ledger["tiered"] if key in present]
+        if len(tiered) != len(ledger["tiered"]):
+            ledger["tiered"] = tiered
+            self._save(ledger)
+        return set(tiered)
@@ -9,21 +9,33 @@ no corruption when multiple browsers connect simultaneously.
 import os
 import time
 import threading
+import json
 import logging
+import datetime
+from urllib.parse import urlencode, urlsplit
 
-from flask import Flask, Response, render_template, request, send_from_directory
+from flask import Flask, Response, abort, jsonify, redirect, render_template, request, send_from_directory
+from werkzeug.security import safe_join
 from web.auth import require_basic_auth
-from utils.config import ConfigSaver
+from utils.config import ConfigSaver, PROFILE_KEYS, RECORD_MODES
 from utils.footage import Footage
 from utils import frame_buffer as fb
+from utils import mosaic
+from utils.indices import native_sizes
+from utils import previews
+from utils.segments import SegmentIndex
+from utils.export import ClipExporter, MAX_RANGE_SECONDS
+from utils.mjpeg_container import MjpegReader
+from utils.metadata import hub as metadata_hub
 
 log = logging.getLogger(__name__)
 
 
 class StreamingServer:
-    def __init__(self, pipe_dir=None, host="0.0.0.0", port=5000, config=None):
+    def __init__(self, pipe_dir=None, host="0.0.0.0", port=5000, config=None, producers=None):
         # pipe_dir kept for API compatibility but is no longer used
         self.config = config
+        self.producers = producers or []
         self.host = host
         self.port = port
 
@@ -39,6 +51,12 @@ class StreamingServer:
         self.app.add_url_rule("/settings", "settings", self.settings, methods=["GET", "POST"])
         self.app.add_url_rule("/recordings", "recordings", self.recordings, methods=["GET"])
         self.app.add_url_rule("/media/<path:filename>", "static_files", self._serve_static)
+        self.app.add_url_rule("/preview/<path:filename>", "preview", self.preview)
+        self.app.add_url_rule("/stream/mosaic.mjpeg", "stream_mosaic", self.stream_mosaic)
+        self.app.add_url_rule("/events", "events", self.events)
+        self.app.add_url_rule("/status", "status", self.status)
+        self.app.add_url_rule("/playback/cam<int:cam_index>", "playback", self.playback)
+        self.app.add_url_rule("/export/cam<int:cam_index>", "export", self.export)
 
     # ------------------------------------------------------------------
     # MJPEG streaming  (one generator instance per connected client)
@@ -56,6 +74,10 @@ class StreamingServer:
         if buf is None:
             return
 
+        yield from self._mjpeg_chunks(buf)
+
+    @staticmethod
+    def _mjpeg_chunks(buf):
         for jpeg_bytes in buf.subscribe(timeout=5.0):
             if jpeg_bytes is None:
                 # Timeout heartbeat – generator will be garbage collected
@@ -64,7 +86,8 @@ class StreamingServer:
 
             yield (
                 b"--frame\r\n"
-                b"Content-Type: image/jpeg\r\n\r\n"
+                b"Content-Type: image/jpeg\r\n"
+                b"Content-Length: %d\r\n\r\n" % len(jpeg_bytes)
                 + jpeg_bytes
                 + b"\r\n"
             )
@@ -77,26 +100,75 @@ class StreamingServer:
             )
         return stream_view
 
+    def stream_mosaic(self):
+        """
+        One composited MJPEG of every camera, e.g.
+        /stream/mosaic.mjpeg?layout=4x3&width=1920.  All viewers asking for the
+        same layout and width share a single compositor and encode.
+        """
+        comp = mosaic.get_or_create(
+            request.args.get("layout"),
+            request.args.get("width", type=int),
+            self.config,
+        )
+        if comp is None:
+            return "Too many mosaic layouts in use", 503
+
+        return Response(
+            self._mjpeg_chunks(comp.frame_buffer),
+            mimetype="multipart/x-mixed-replace; boundary=frame",
+        )
+
+    def events(self):
+        """
+        Server-Sent Events stream of per-camera metadata (motion state, motion
+        box, capture time).  The live view draws overlays from this so the
+        frames themselves stay unannotated.  Updates are coalesced to at most
+        ten per second per client.
+        """
+        def generate():
+            yield "retry: 3000\n\n"
+            for updates in metadata_hub.subscribe(timeout=15.0):
+                if not updates:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps(updates)}\n\n"
+                time.sleep(0.1)
+
+        return Response(
+            generate(),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
     # ------------------------------------------------------------------
     # Route registration  (called after producers have started)
     # ------------------------------------------------------------------
 
+    def _producer(self, cam_index: int):
+        return next((p for p in self.producers if p.cam_index == cam_index), None)
+
     def add_routes(self):
         for cam_index, buf in fb.all_buffers().items():
             route_path = f"/stream/cam{cam_index}.mjpeg"
             endpoint   = f"stream_cam{cam_index}"
+            profile    = self.config.profile(cam_index)
 
             self.app.add_url_rule(
                 route_path, endpoint, self._make_stream_route(cam_index)
             )
 
-            self.routes_created.append({
+            route = {
+                "cam":        cam_index,
                 "name":       f"cam{cam_index}.mjpeg",
                 "url":        route_path,
-                "resolution": f"{self.config.camera_width}x{self.config.camera_height}",
-                "framerate":  self.config.camera_fps,
                 "show_info":  True,
-            })
+            }
+            # Relayed cameras are labelled from the remote node at render time
+            if not hasattr(self._producer(cam_index), "stream_info"):
+                route["resolution"] = f"{profile.camera_width}x{profile.camera_height}"
+                route["framerate"] = profile.camera_fps
+            self.routes_created.append(route)
             log.info(f"Streaming route registered: {route_path}")
 
     # ------------------------------------------------------------------
@@ -106,15 +178,44 @@ class StreamingServer:
     # Uncomment the decorator below to enable HTTP Basic Auth:
     # @require_basic_auth
     def index(self):
+        cameras = []
+        for route in self.routes_created:
+            producer = self._producer(route["cam"])
+            if hasattr(producer, "stream_info"):
+                route = {**route, **producer.stream_info()}
+            cameras.append(route)
+        # ?view=mosaic swaps the per-camera grid for one composited stream,
+        # which is far lighter on low-end wall displays.
+        if request.args.get("view") == "mosaic":
+            query = urlencode(
+                {k: request.args[k] for k in ("layout", "width") if k in request.args}
+            )
+            cameras = [{
+                "name":      "mosaic.mjpeg",
+                "url":       "/stream/mosaic.mjpeg" + (f"?{query}" if query else ""),
+                "show_info": False,
+            }]
+
+        # Streams come from the worker processes when they are enabled
+        if getattr(self.config, "server_stream_workers", 0) > 0:
+            host = urlsplit("//" + request.host).hostname
+            origin = f"//[{host}]" if ":" in host else f"//{host}"
+            origin += f":{self.config.server_stream_port}"
+            cameras = [{**camera, "url": origin + camera["url"]} for camera in cameras]
+
         return render_template(
             "index.html",
-            cameras=self.routes_created,
+            cameras=cameras,
             page="live",
             page_title="Live View",
             status_text="Connected",
         )
         
 
+    def status(self):
+        """Per-camera capture health (live / retrying / dead) as JSON."""
+        return jsonify([p.status() for p in self.producers])
+
     def _serve_static(self, filename):
         if filename.endswith(".jpg"):
             return send_from_directory(
@@ -131,12 +232,124 @@ class StreamingServer:
                 conditional=True  # enables range request support for seeking
             )
 
+        if filename.endswith(".mjpg") and "raw" not in request.args:
+            path = safe_join(self.config.storage_path, filename)
+            if path is None or not os.path.isfile(path):
+                abort(404)
+            return Response(
+                self._replay_mjpeg(path, request.args.get("t", 0.0, type=float)),
+                mimetype="multipart/x-mixed-replace; boundary=frame",
+            )
+
         return send_from_directory(
             self.config.storage_path,
             filename,
             mimetype="application/octet-stream"
         )
         
+    def preview(self, filename):
+        """
+        Scrub-preview sidecars of a clip: <clip>.preview.json and
+        <clip>.sprite.jpg (see utils/previews.py).  The sprite is requested
+        with ?v=<built> from the index, so it can be cached indefinitely; the
+        index itself is revalidated hourly.
+        """
+        if filename.endswith(previews.SPRITE_SUFFIX):
+            response = send_from_directory(self.config.storage_path, filename,
+                                           mimetype="image/jpeg", max_age=365 * 86400)
+            response.cache_control.immutable = True
+            return response
+        if filename.endswith(previews.INDEX_SUFFIX):
+            return send_from_directory(self.config.storage_path, filename,
+                                       mimetype="application/json", max_age=3600)
+        abort(404)
+
+    @staticmethod
+    def _replay_mjpeg(path: str, offset: float = 0.0):
+        """Play an .mjpg recording back as MJPEG, paced by its capture timestamps."""
+        reader = MjpegReader(path)
+        if not len(reader):
+            return
+
+        prev_ts = None
+        for ts, jpeg_bytes in reader.frames(reader.start + offset):
+            if prev_ts is not None:
+                time.sleep(min(max(ts - prev_ts, 0.0), 1.0))
+            prev_ts = ts
+            yield (
+                b"--frame\r\n"
+                b"Content-Type: image/jpeg\r\n"
+                b"Content-Length: %d\r\n\r\n" % len(jpeg_bytes)
+                + jpeg_bytes
+                + b"\r\n"
+            )
+
+    @require_basic_auth
+    def playback(self, cam_index):
+        """
+        Resolve ?at=YYYY-MM-DDTHH:MM:SS to the segment that covers it.
+
+        Redirects to the segment with a #t= media fragment so the browser
+        starts playing at the right offset; add &format=json to get the
+        segment URL and offset instead.
+        """
+        try:
+            at = datetime.datetime.fromisoformat(request.args["at"])
+        except (KeyError, ValueError):
+            return "Missing or invalid 'at' timestamp", 400
+
+        index = SegmentIndex(self.config.storage_path, cam_index)
+        found = index.lookup(at)
+        if found is None:
+            return "No recording at that time", 404
+
+        entry, offset = found
+        url = "/media/" + index.media_path(entry["path"])
+        fragment = f"?t={offset:.1f}" if url.endswith(".mjpg") else f"#t={offset:.1f}"
+
+        if request.args.get("format") == "json":
+            return jsonify({
+                "url":    url,
+                "offset": round(offset, 3),
+                "start":  entry["start"],
+                "end":    entry["end"],
+            })
+        return redirect(url + fragment)
+
+    @require_basic_auth
+    def export(self, cam_index):
+        """
+        Stream ?start=...&end=... (ISO timestamps) as one MP4, cut across
+        however many clips or segments the range touches.
+        """
+        try:
+            start = datetime.datetime.fromisoformat(request.args["start"])
+            end = datetime.datetime.fromisoformat(request.args["end"])
+        except (KeyError, ValueError):
+            return "Missing or invalid 'start'/'end' timestamp", 400
+
+        if end <= start:
+            return "'end' must be after 'start'", 400
+        if (end - start).total_seconds() > MAX_RANGE_SECONDS:
+            return f"Range too long (max {MAX_RANGE_SECONDS // 3600} hours)", 400
+
+        exporter = ClipExporter(self.config.profile(cam_index))
+        sources = exporter.sources(cam_index, start.timestamp(), end.timestamp())
+        if not sources:
+            return "No recordings in that range", 404
+        max_range = exporter.max_range(sources)
+        if (end - start).total_seconds() > max_range:
+            return (f"Range too long to re-encode (max {max_range // 60} minutes "
+                    f"without ffmpeg or when .mjpg clips are included)"), 400
+
+        filename = f"cam{cam_index}_{start:%Y%m%d_%H%M%S}-{end:%H%M%S}.mp4"
+        log.info(f"Exporting {filename} from {len(sources)} source(s)")
+        return Response(
+            exporter.stream(sources),
+            mimetype="video/mp4",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+
     @require_basic_auth
     def recordings(self):
         footage = Footage(self.config.storage_path)
@@ -159,6 +372,7 @@ class StreamingServer:
                 page_title="Settings",
                 status_text="Connected",
                 config=self.config,
+                camera_modes={p.cam_index: native_sizes(p.capabilities) for p in self.producers},
             )
 
         # POST – save JSON settings and trigger config reload
@@ -167,25 +381,77 @@ class StreamingServer:
             return "Bad request", 400
 
         try:
-            self.config_saver.save(
-                **{
-                    "camera.width":               int(data["resolution"].split("x")[0]),
-                    "camera.height":              int(data["resolution"].split("x")[1]),
-                    "camera.fps":                 int(data["frameRate"]),
-                    "camera.motion_detection":    bool(data["motionDetection"]),
-                    "camera.motion_contour_area": int(data["sensitivity"]),
-                    "record.enabled":             bool(data["record"]),
-                    "record.recording_length":    int(data["recordingLength"]),
-                    "record.storage_path":        data["storagePath"],
-                    "record.video_retention":     float(data["videoRetention"]),
-                }
-            )
+            paths = {
+                "camera.width":               int(data["resolution"].split("x")[0]),
+                "camera.height":              int(data["resolution"].split("x")[1]),
+                "camera.fps":                 int(data["frameRate"]),
+                "camera.motion_detection":    bool(data["motionDetection"]),
+                "camera.motion_contour_area": int(data["sensitivity"]),
+                "record.enabled":             bool(data["record"]),
+                "record.mode":                self._record_mode(data["recordMode"]),
+                "record.recording_length":    int(data["recordingLength"]),
+                "record.storage_path":        data["storagePath"],
+                "record.video_retention":     float(data["videoRetention"]),
+            }
+            if "cameras" in data:
+                paths["cameras"] = self._camera_entries(data["cameras"], paths)
+            self.config_saver.save(**paths)
         except (KeyError, ValueError) as exc:
             log.error(f"Settings save error: {exc}")
             return f"Invalid data: {exc}", 400
 
         return "ok", 200
 
+    @staticmethod
+    def _record_mode(value):
+        if value not in RECORD_MODES:
+            raise ValueError(f"record mode must be one of {', '.join(RECORD_MODES)}")
+        return value
+
+    def _camera_entries(self, cameras, globals_):
+        """
+        Turn the per-camera rows from the settings page into `cameras:`
+        entries.  Rows are pre-filled with each camera's current effective
+        values, so a value is stored as an override only if the camera
+        already overrode it or it was edited on this save – anything else
+        keeps following the globals.  Overrides the form has no field for
+        (e.g. motion_contour_area) are carried over unchanged.
+        """
+        defaults = {
+            "width":            globals_["camera.width"],
+            "height":           globals_["camera.height"],
+            "fps":              globals_["camera.fps"],
+            "jpeg_quality":     self.config.jpeg_quality,
+            "motion_detection": globals_["camera.motion_detection"],
+            "motion_interval":  self.config.motion_interval,
+            "record":           globals_["record.enabled"],
+            "record_mode":      globals_["record.mode"],
+        }
+
+        entries = []
+        for cam in cameras:
+            index = int(cam["index"])
+            profile = self.config.profile(index)
+            width, height = (int(v) for v in cam["resolution"].split("x"))
+            values = {
+                "width":            width,
+                "height":           height,
+                "fps":              int(cam["frameRate"]),
+                "jpeg_quality":     min(max(int(cam["jpegQuality"]), 1), 100),
+                "motion_detection": bool(cam["motionDetection"]),
+                "motion_interval":  max(int(cam["motionInterval"]), 1),
+                "record":           bool(cam["record"]),
+                "record_mode":      self._record_mode(cam["recordMode"]),
+            }
+
+            overrides = {k: v for k, v in profile.overrides.items() if k not in values}
+            for key, value in values.items():
+                edited = value != getattr(profile, PROFILE_KEYS[key])
+                if (key in profile.overrides or edited) and value != defaults[key]:
+                    overrides[key] = value
+            entries.append({"index": index, **overrides} if overrides else index)
+        return entries
+
     # ------------------------------------------------------------------
     # Server lifecycle
     # ------------------------------------------------------------------
@@ -211,4 +477,5 @@ class StreamingServer:
         # since the thread is daemonised it dies with the process.
         # For production, swap app.run() for a Werkzeug/Waitress server.
         self._stop_event.set()
+        mosaic.stop_all()
         log.info("StreamingServer stop requested.")
\ No newline at end of file
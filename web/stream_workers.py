@@ -0,0 +1,182 @@
+"""
+stream_workers.py  –  web/stream_workers.py
+
+Serve live MJPEG from processes separate from capture.
+
+With `server.stream_workers: N`, every camera's FrameBuffer is a
+SharedFrameBuffer (utils/frame_buffer.py) and N worker processes serve
+/stream/cam{n}.mjpeg and /stream/mosaic.mjpeg on `server.stream_port`.
+Each worker binds the port with SO_REUSEPORT, so the kernel spreads new
+connections across them.  Viewer load then scales across cores without
+contending for the capture process's GIL, and a worker that dies is simply
+restarted – capture and recording carry on.
+
+The main server still serves the pages, /events, /status and its own
+/stream routes (relays and existing links keep working); the live view
+points its streams at the worker port.
+
+Buffers registered after the workers start (relays, re-plugged cameras)
+are picked up by the supervisor, which sends every worker the current set
+of segment names over a queue whenever it changes.
+
+    workers = StreamWorkers(config)
+    workers.start()         # after the producers have registered their buffers
+"""
+
+import socket
+import logging
+import threading
+import multiprocessing
+from typing import Optional
+
+from flask import Flask, Response, request
+from werkzeug.serving import make_server
+
+from utils import frame_buffer as fb
+from utils import mosaic
+from utils.config import ConfigLoader
+from web.server import StreamingServer
+
+log = logging.getLogger(__name__)
+
+SUPERVISE_INTERVAL = 2.0        # seconds between checks for dead workers
+
+
+class StreamWorkers:
+    def __init__(self, config):
+        self.config = config
+        self.count = min(int(getattr(config, "server_stream_workers", 0)), fb.MAX_READERS)
+        self.host = getattr(config, "server_host", "0.0.0.0")
+        self.port = int(getattr(config, "server_stream_port", 5001))
+
+        # Spawn, not fork: the capture process is full of threads
+        self._context = multiprocessing.get_context("spawn")
+        self._names: dict[int, str] = {}
+        self._processes: list[Optional[multiprocessing.Process]] = []
+        self._queues: list = []         # per worker: buffer registrations
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.count <= 0:
+            return
+        self._names = fb.shared_names()
+        self._queues = [None] * self.count
+        self._processes = [self._spawn(worker_id) for worker_id in range(self.count)]
+        log.info(f"[StreamWorkers] {self.count} worker(s) serving {len(self._names)} camera(s) "
+                 f"on port {self.port}")
+        self._thread = threading.Thread(target=self._supervise, daemon=True, name="stream-workers")
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            if process is not None:
+                process.join(timeout=5.0)
+        for registrations in self._queues:
+            if registrations is not None:
+                registrations.cancel_join_thread()
+
+    def _spawn(self, worker_id: int) -> multiprocessing.Process:
+        self._queues[worker_id] = self._context.Queue()
+        process = self._context.Process(
+            target=_serve,
+            args=(self.host, self.port, self._names, worker_id, self._queues[worker_id]),
+            daemon=True,
+            name=f"stream-worker-{worker_id}",
+        )
+        process.start()
+        return process
+
+    def _supervise(self) -> None:
+        while not self._stop_event.wait(timeout=SUPERVISE_INTERVAL):
+            names = fb.shared_names()
+            if names != self._names:
+                log.info(f"[StreamWorkers] Buffers changed - now serving {len(names)} camera(s)")
+                self._names = names
+                for registrations in self._queues:
+                    registrations.put(names)
+
+            for worker_id, process in enumerate(self._processes):
+                if not process.is_alive():
+                    log.warning(f"[StreamWorkers] Worker {worker_id} exited "
+                                f"(code {process.exitcode}) - restarting")
+                    self._processes[worker_id] = self._spawn(worker_id)
+
+
+# ------------------------------------------------------------------
+# Worker process
+# ------------------------------------------------------------------
+
+def _mjpeg_response(buf) -> Response:
+    return Response(
+        StreamingServer._mjpeg_chunks(buf),
+        mimetype="multipart/x-mixed-replace; boundary=frame",
+    )
+
+
+def _build_app(config) -> Flask:
+    app = Flask(__name__)
+
+    def stream_cam(cam_index):
+        buf = fb.get(cam_index)
+        if buf is None:
+            return "Unknown camera", 404
+        return _mjpeg_response(buf)
+
+    def stream_mosaic():
+        comp = mosaic.get_or_create(
+            request.args.get("layout"),
+            request.args.get("width", type=int),
+            config,
+        )
+        if comp is None:
+            return "Too many mosaic layouts in use", 503
+        return _mjpeg_response(comp.frame_buffer)
+
+    app.add_url_rule("/stream/cam<int:cam_index>.mjpeg", "stream_cam", stream_cam)
+    app.add_url_rule("/stream/mosaic.mjpeg", "stream_mosaic", stream_mosaic)
+    return app
+
+
+def _listen(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    return sock
+
+
+def _attach_all(names: dict[int, str], worker_id: int) -> None:
+    """Attach every buffer in `names` this worker doesn't already follow."""
+    for cam_index, name in names.items():
+        buf = fb.get(cam_index)
+        if getattr(buf, "name", None) == name and not buf.closed:
+            continue
+        try:
+            fb.attach(cam_index, name, worker_id)
+        except FileNotFoundError:
+            log.warning(f"[StreamWorkers] Worker {worker_id}: buffer {name} is gone")
+
+
+def _follow_registrations(registrations, worker_id: int) -> None:
+    while True:
+        _attach_all(registrations.get(), worker_id)
+
+
+def _serve(host: str, port: int, names: dict[int, str], worker_id: int, registrations) -> None:
+    _attach_all(names, worker_id)
+    threading.Thread(target=_follow_registrations, args=(registrations, worker_id),
+                     daemon=True, name="stream-registrations").start()
+
+    sock = _listen(host, port)
+    server = make_server(host, port, _build_app(ConfigLoader()), threaded=True, fd=sock.fileno())
+    log.info(f"[StreamWorkers] Worker {worker_id} listening on {host}:{port}")
+    server.serve_forever()